@@ -0,0 +1,79 @@
+"""Dashboard engine that joins marks onto subjects inside MongoDB.
+
+Selected with DASHBOARD_ENGINE=aggregation. The `$lookup`, grade banding and
+per-semester `$group` run in the database; only the final SGPA/CGPA division
+and rounding happen in Python (via `gpa.summarize`) so results match the
+Python implementation exactly.
+"""
+from gpa import SEMESTERS, summarize
+from grading import DEFAULT_SCHEME, GradingScheme
+
+
+def score_expression(scheme: GradingScheme, marks_path: str) -> dict:
+    """Weighted score of a marks document, with missing components counting as zero"""
+    terms = [
+        {"$multiply": [weight, {"$ifNull": [f"{marks_path}.{component}", 0.0]}]}
+        for component, weight in scheme.weighted()
+    ]
+    return {"$add": [0.0] + terms}
+
+
+def grade_point_switch(scheme: GradingScheme, marks_path: str) -> dict:
+    """`$switch` equivalent of `GradingScheme.grade_point`"""
+    score = score_expression(scheme, marks_path)
+    failed = []
+    if scheme.pass_final_exam is not None:
+        failed.append({"$lt": [f"{marks_path}.final_exam", scheme.pass_final_exam]})
+    if scheme.pass_score is not None:
+        failed.append({"$lt": [score, scheme.pass_score]})
+
+    branches = [{"case": {"$or": failed}, "then": scheme.fail_grade_point}] if failed else []
+    branches += [
+        {"case": {"$gte": [score, minimum]}, "then": grade_point}
+        for minimum, grade_point in scheme.bands
+    ]
+    return {"$switch": {"branches": branches, "default": scheme.fail_grade_point}}
+
+
+def dashboard_pipeline(student: dict, scheme: GradingScheme = DEFAULT_SCHEME) -> list:
+    return [
+        {"$match": {"department": student["department"],
+                    "semester": {"$gte": SEMESTERS.start, "$lt": SEMESTERS.stop}}},
+        # Creation order, as in the materialized engine
+        {"$sort": {"_id": 1}},
+        {"$replaceWith": {"subject": "$$ROOT"}},
+        {"$unset": "subject._id"},
+        {"$lookup": {
+            "from": "marks",
+            "localField": "subject.id",
+            "foreignField": "subject_id",
+            "let": {"semester": "$subject.semester"},
+            "pipeline": [
+                {"$match": {"student_id": student["id"]}},
+                {"$match": {"$expr": {"$eq": ["$semester", "$$semester"]}}},
+                {"$project": {"_id": 0}},
+                {"$limit": 1},
+            ],
+            "as": "marks",
+        }},
+        {"$unwind": "$marks"},
+        {"$match": {"marks.final_exam": {"$ne": None}}},
+        {"$group": {
+            "_id": "$subject.semester",
+            "subjects": {"$push": {
+                "subject": "$subject",
+                "marks": "$marks",
+                "grade_point": grade_point_switch(scheme, "$marks"),
+            }},
+        }},
+    ]
+
+
+async def aggregate_semester_data(db, student: dict, scheme: GradingScheme = DEFAULT_SCHEME):
+    """semester_data and CGPA for one student, computed by a single aggregation over subjects"""
+    entries_by_semester = {}
+    async for group in db.subjects.aggregate(dashboard_pipeline(student, scheme)):
+        entries_by_semester[group["_id"]] = [
+            (item["subject"], item["marks"], item["grade_point"]) for item in group["subjects"]
+        ]
+    return summarize(entries_by_semester)
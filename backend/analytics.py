@@ -0,0 +1,113 @@
+"""Per-subject and per-semester marks statistics, computed with NumPy.
+
+Only marks that count towards SGPA (final exam entered, same semester as the
+subject) are included. Results are cached by the callers under the marks
+version of every subject involved: marks writes bump `marks:<subject id>` in
+`cache_versions`, so a save invalidates exactly the statistics it affects.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from pymongo import UpdateOne
+
+from grading import GradingScheme, mark_columns
+
+PERCENTILES = (10, 25, 75, 90)
+MARKS_PROJECTION = {"_id": 0, "subject_id": 1, "semester": 1, "internal1": 1, "internal2": 1, "internal3": 1,
+                    "final_exam": 1}
+
+
+def _version_id(subject_id: str) -> str:
+    return f"marks:{subject_id}"
+
+
+async def bump_marks_versions(db, subject_ids: Iterable[str]) -> None:
+    """Mark the statistics of these subjects stale"""
+    operations = [
+        UpdateOne({"_id": _version_id(subject_id)}, {"$inc": {"version": 1}}, upsert=True)
+        for subject_id in set(subject_ids)
+    ]
+    if operations:
+        await db.cache_versions.bulk_write(operations, ordered=False)
+
+
+async def marks_versions(db, subject_ids: List[str]) -> Tuple[Tuple[str, int], ...]:
+    """(subject id, marks version) pairs, usable as a cache version"""
+    versions = {
+        doc["_id"]: doc["version"]
+        async for doc in db.cache_versions.find({"_id": {"$in": [_version_id(s) for s in subject_ids]}})
+    }
+    return tuple(sorted((subject_id, versions.get(_version_id(subject_id), 0)) for subject_id in subject_ids))
+
+
+def _round(value) -> float:
+    return round(float(value), 2)
+
+
+def describe(values: np.ndarray) -> Optional[dict]:
+    if not len(values):
+        return None
+    percentiles = np.percentile(values, PERCENTILES)
+    return {
+        "mean": _round(values.mean()),
+        "median": _round(np.median(values)),
+        "std": _round(values.std()),
+        "min": _round(values.min()),
+        "max": _round(values.max()),
+        "percentiles": {f"p{p}": _round(value) for p, value in zip(PERCENTILES, percentiles)},
+    }
+
+
+def statistics(columns: Dict[str, np.ndarray], scheme: GradingScheme) -> dict:
+    """Distribution of final exam marks, weighted scores and grade points for one group of marks"""
+    grade_points = scheme.grade(columns)
+    count = len(grade_points)
+    passed = int((grade_points > scheme.fail_grade_point).sum())
+    bands = [point for _, point in scheme.bands] + [scheme.fail_grade_point]
+    counts = {point: int((grade_points == point).sum()) for point in bands}
+    return {
+        "count": count,
+        "final_exam": describe(columns["final_exam"]),
+        "score": describe(scheme.scores(columns)),
+        "grade_point": describe(grade_points),
+        "pass_rate": _round(passed / count) if count else None,
+        "grades": [{"grade_point": point, "count": counts[point]} for point in dict.fromkeys(bands)],
+    }
+
+
+def _select(columns: Dict[str, np.ndarray], mask: np.ndarray) -> Dict[str, np.ndarray]:
+    return {component: values[mask] for component, values in columns.items()}
+
+
+async def _graded_marks(db, subjects: List[dict]) -> Tuple[List[dict], Dict[str, np.ndarray]]:
+    semester_of = {subject["id"]: subject["semester"] for subject in subjects}
+    cursor = db.marks.find(
+        {"subject_id": {"$in": list(semester_of)}, "final_exam": {"$ne": None}}, MARKS_PROJECTION
+    ).batch_size(5000)
+    docs = [doc async for doc in cursor if doc.get("semester") == semester_of[doc["subject_id"]]]
+    return docs, mark_columns(docs)
+
+
+async def subject_statistics(db, subject: dict, scheme: GradingScheme) -> dict:
+    _, columns = await _graded_marks(db, [subject])
+    return {"subject": subject, **statistics(columns, scheme)}
+
+
+async def department_statistics(db, department: str, subjects: List[dict], scheme: GradingScheme) -> dict:
+    """Statistics per semester, with a per-subject breakdown, for a department's subjects"""
+    docs, columns = await _graded_marks(db, subjects)
+    subject_ids = np.array([doc["subject_id"] for doc in docs], dtype=object)
+    semesters = np.array([doc["semester"] for doc in docs], dtype=int)
+
+    semester_stats = []
+    for sem in sorted({subject["semester"] for subject in subjects}):
+        semester_mask = semesters == sem
+        semester_stats.append({
+            "semester": sem,
+            **statistics(_select(columns, semester_mask), scheme),
+            "subjects": [
+                {"subject": subject, **statistics(_select(columns, subject_ids == subject["id"]), scheme)}
+                for subject in subjects if subject["semester"] == sem
+            ],
+        })
+    return {"department": department, "semesters": semester_stats}
@@ -0,0 +1,170 @@
+"""Password hashing off the event loop, with admission control, and token verification.
+
+bcrypt is deliberately slow (about 250ms at cost 12), so hashing and
+verification run on a small dedicated executor rather than on the event loop
+or the default threadpool that Motor and uploads share. A semaphore bounds the
+work in flight plus waiting; when it is full, callers get `HasherBusy` right
+away and the API answers 503 with Retry-After instead of queueing logins
+behind each other.
+
+Every authenticated request presents the same JWT over and over, so
+`TokenVerifier` keeps verified payloads in an LRU and only checks `exp` on a
+hit; the signature is checked once per token and worker.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, List, Optional, Tuple
+
+import jwt
+from passlib.context import CryptContext
+from pydantic import AfterValidator, Field
+
+from cache import MISSING, MemoryBackend
+from metrics import REGISTRY
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+# Hashes allowed in flight or waiting for a worker before new ones are shed
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', PASSWORD_HASH_WORKERS * 8))
+PASSWORD_HASH_RETRY_AFTER = int(os.environ.get('PASSWORD_HASH_RETRY_AFTER', 2))
+
+PASSWORD_MIN_LENGTH = 8
+# bcrypt ignores everything past 72 bytes, which is fewer than 72 characters outside ASCII
+PASSWORD_MAX_BYTES = 72
+
+
+def password_fits_bcrypt(password: str) -> bool:
+    return len(password.encode()) <= PASSWORD_MAX_BYTES
+
+
+def _check_password_bytes(password: str) -> str:
+    if not password_fits_bcrypt(password):
+        raise ValueError(f"Password must be at most {PASSWORD_MAX_BYTES} bytes in UTF-8")
+    return password
+
+
+# The field type of every password a client sets
+Password = Annotated[str, Field(min_length=PASSWORD_MIN_LENGTH), AfterValidator(_check_password_bytes)]
+
+# Hashes with any other cost are rehashed on the next successful login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+PASSWORD_HASH_OPERATIONS = REGISTRY.counter(
+    "password_hash_operations_total", "bcrypt hash/verify operations by outcome", ("operation", "outcome"))
+IDENTITY_CACHE_REQUESTS = REGISTRY.counter(
+    "identity_cache_requests_total", "Verified-token and user cache lookups by result", ("cache", "result"))
+
+
+class HasherBusy(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Password hashing is at capacity")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    def __init__(self, context: CryptContext, workers: int, queue: int, retry_after: int):
+        self.context = context
+        self.retry_after = retry_after
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._queue = queue
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use, and again after `shutdown` (one process can run several app lifespans)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    def _admission(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._queue)
+        return self._slots
+
+    async def _run(self, operation: str, fn, *args):
+        slots = self._admission()
+        if slots.locked():
+            PASSWORD_HASH_OPERATIONS.inc(operation, "shed")
+            raise HasherBusy(self.retry_after)
+        async with slots:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        PASSWORD_HASH_OPERATIONS.inc(operation, "done")
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, password_hash: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """(valid, replacement hash if the stored one uses outdated settings)"""
+        if not password_hash:
+            # Same cost as a real check, so unknown accounts are not distinguishable by timing
+            await self._run("verify", self.context.dummy_verify)
+            return False, None
+        return await self._run("verify", self.context.verify_and_update, password, password_hash)
+
+    async def hash_batch(self, passwords: List[str]) -> List[str]:
+        """Hash many passwords (roster imports) on at most half the workers, so sign-ins keep flowing
+
+        Each hash holds an admission slot like any other, so sign-ins are shed on
+        the real backlog; a batch waits for slots instead of being shed itself.
+        """
+        loop = asyncio.get_running_loop()
+        lanes = asyncio.Semaphore(max(1, self.workers // 2))
+        slots = self._admission()
+
+        async def hash_one(password: str) -> str:
+            async with lanes, slots:
+                return await loop.run_in_executor(self._pool(), self.context.hash, password)
+
+        hashes = await asyncio.gather(*(hash_one(password) for password in passwords))
+        PASSWORD_HASH_OPERATIONS.inc("hash", "done", amount=len(hashes))
+        return hashes
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class TokenVerifier:
+    """`jwt.decode` behind an LRU of verified payloads, each honoured until its own `exp`
+
+    Payloads are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, secret: str, algorithm: str, maxsize: int):
+        self.secret = secret
+        self.algorithm = algorithm
+        # Entries live until evicted; expiry is per token
+        self._verified = MemoryBackend(maxsize=maxsize, ttl=float("inf"))
+
+    def decode(self, token: str) -> dict:
+        payload = self._verified.get(token)
+        if payload is not MISSING:
+            expires_at = payload.get("exp")
+            if expires_at is None or expires_at > time.time():
+                IDENTITY_CACHE_REQUESTS.inc("token", "hit")
+                return payload
+            self._verified.delete(token)
+            raise jwt.ExpiredSignatureError("Signature has expired")
+
+        IDENTITY_CACHE_REQUESTS.inc("token", "miss")
+        # Invalid and expired tokens raise here and are never cached
+        payload = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        self._verified.set(token, payload)
+        return payload
+
+    def __len__(self) -> int:
+        return len(self._verified)
+
+
+hasher = PasswordHasher(pwd_context, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_RETRY_AFTER)
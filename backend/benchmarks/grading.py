@@ -0,0 +1,103 @@
+"""Grading throughput: scalar per-row grading vs the vectorized searchsorted engine.
+
+    cd backend && python -m benchmarks.grading [--rows 1000000] [--repeat 3]
+
+Besides the random rows, every scheme is fed marks exactly on each band and
+pass boundary and a hair either side of it; the run exits non-zero if any
+engine grades a row differently from the scalar loop.
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from grading import DEFAULT_SCHEME, GRADE_BANDS, MARK_COMPONENTS, GradingScheme, calculate_grade_point
+
+WEIGHTED = GradingScheme(
+    {"internal1": 0.1, "internal2": 0.1, "internal3": 0.1, "final_exam": 0.7},
+    [(85, 10.0), (75, 9.0), (65, 8.0), (55, 7.0), (45, 6.0), (35, 5.0)],
+    pass_final_exam=30,
+)
+# Binary-exact weights, so marks equal to a boundary score exactly on it
+PASS_RULES = GradingScheme({"internal1": 0.25, "final_exam": 0.75}, GRADE_BANDS, pass_final_exam=35, pass_score=45)
+
+
+def mark_columns(rows: int, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    columns = {component: rng.uniform(0, 40, rows).round(1) for component in MARK_COMPONENTS[:3]}
+    columns["final_exam"] = rng.uniform(0, 100, rows).round(1)
+    # Some internals are not entered yet
+    columns["internal3"][rng.random(rows) < 0.2] = np.nan
+    return columns
+
+
+def boundary_columns(*schemes: GradingScheme) -> dict:
+    """Rows with every component on each band minimum and pass mark, and 1e-5 either side of it"""
+    boundaries = set()
+    for scheme in schemes:
+        boundaries.update(minimum for minimum, _ in scheme.bands)
+        boundaries.update(mark for mark in (scheme.pass_final_exam, scheme.pass_score) if mark is not None)
+    values = np.array(sorted(value + offset for value in boundaries for offset in (-1e-5, 0.0, 1e-5)))
+    # The same values again with the internals missing
+    internals = np.concatenate([values, np.full(len(values), np.nan)])
+    columns = {component: internals.copy() for component in MARK_COMPONENTS[:3]}
+    columns["final_exam"] = np.concatenate([values, values])
+    return columns
+
+
+def mark_docs(columns: dict) -> list:
+    values = [columns[component].tolist() for component in MARK_COMPONENTS]
+    return [
+        {component: (None if value != value else value) for component, value in zip(MARK_COMPONENTS, row)}
+        for row in zip(*values)
+    ]
+
+
+def best_seconds(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    random_columns = mark_columns(args.rows)
+    edges = boundary_columns(DEFAULT_SCHEME, WEIGHTED, PASS_RULES)
+    columns = {component: np.concatenate([random_columns[component], edges[component]])
+               for component in MARK_COMPONENTS}
+    docs = mark_docs(columns)
+    finals = columns["final_exam"].tolist()
+
+    cases = [
+        ("default: calculate_grade_point loop", lambda: [calculate_grade_point(final) for final in finals]),
+        ("default: scheme.grade_point loop", lambda: [DEFAULT_SCHEME.grade_point(doc) for doc in docs]),
+        ("default: scheme.grade (NumPy)", lambda: DEFAULT_SCHEME.grade(columns).tolist()),
+        ("weighted: scheme.grade_point loop", lambda: [WEIGHTED.grade_point(doc) for doc in docs]),
+        ("weighted: scheme.grade (NumPy)", lambda: WEIGHTED.grade(columns).tolist()),
+        ("pass rules: scheme.grade_point loop", lambda: [PASS_RULES.grade_point(doc) for doc in docs]),
+        ("pass rules: scheme.grade (NumPy)", lambda: PASS_RULES.grade(columns).tolist()),
+    ]
+
+    print(f"Grading {args.rows:,} mark rows plus {len(edges['final_exam'])} boundary rows (best of {args.repeat})")
+    results = {}
+    mismatches = 0
+    for name, fn in cases:
+        kind = name.split(":")[0]
+        elapsed, grades = best_seconds(fn, args.repeat)
+        baseline, expected = results.setdefault(kind, (elapsed, grades))
+        match = "same grades" if grades == expected else "MISMATCH"
+        mismatches += grades != expected
+        print(f"  {name:<40} {elapsed * 1000:9.1f} ms   {baseline / elapsed:6.1f}x   {match}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""Load test for the backend API against a synthetic department.
+
+Seeds a local MongoDB database with N students, M subjects per semester and
+full marks, then drives the API with concurrent async clients through three
+scenarios:
+
+    marks_entry      teachers saving marks during exam week
+    dashboard_storm  students refreshing dashboards after results release
+    catalog          subject catalog and roster browsing
+
+and reports p50/p95/p99 latency and requests/second per endpoint.
+
+    cd backend
+    python -m benchmarks.loadtest --students 2000 --concurrency 64 --save-baseline
+    python -m benchmarks.loadtest --compare benchmarks/baselines/<commit>.json
+
+By default the FastAPI app runs in-process (httpx ASGI transport) against a
+scratch database `<DB_NAME>_bench`. Pass --base-url to load a running server
+instead; this process seeds and drops the database named by --db-name, so
+start that server with the same MONGO_URL and JWT_SECRET and with DB_NAME set
+to the scratch database. Only databases ending in `_bench` are ever seeded or
+dropped. Any other name needs --skip-seed --keep-data, and marks_entry is
+refused there since it writes marks; the other scenarios only read, though
+dashboards still materialize GPA documents a database is missing.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+BENCH_DIR = Path(__file__).parent
+BASELINE_DIR = BENCH_DIR / "baselines"
+DEPARTMENT = "BENCH"
+SEMESTERS = 8
+SCRATCH_SUFFIX = "_bench"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--subjects-per-semester", type=int, default=6)
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients per scenario")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds per scenario")
+    parser.add_argument("--scenario", action="append", choices=["marks_entry", "dashboard_storm", "catalog"],
+                        help="Run only these scenarios (repeatable)")
+    parser.add_argument("--db-name", default=None,
+                        help="Scratch database (default: <DB_NAME>_bench); with --base-url, the server's DB_NAME")
+    parser.add_argument("--base-url", default=None,
+                        help="Load a running server instead of the in-process app (see --db-name)")
+    parser.add_argument("--keep-data", action="store_true", help="Leave the seeded database in place")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse data seeded by an earlier --keep-data run")
+    parser.add_argument("--save-baseline", nargs="?", const="", default=None, metavar="PATH",
+                        help="Write results as a JSON baseline (default: benchmarks/baselines/<commit>.json)")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=20.0,
+                        help="Fail --compare when an endpoint's p95 regresses by more than this percent")
+    parser.add_argument("--seed", type=int, default=7, help="Random seed for data and request mix")
+    return parser.parse_args(argv)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Seeding
+def synthetic_department(students: int, subjects_per_semester: int, rng: random.Random):
+    now = datetime.now(timezone.utc)
+    teacher = {"id": str(uuid.uuid4()), "name": "Bench Teacher", "email": "bench.teacher@example.edu",
+               "student_id": None, "role": "teacher", "department": DEPARTMENT, "semester": None, "created_at": now}
+    subjects = [
+        {"id": str(uuid.uuid4()), "name": f"Subject {sem}.{index}", "code": f"BN{sem}{index:02d}",
+         "semester": sem, "credits": rng.randint(2, 5), "department": DEPARTMENT, "created_at": now}
+        for sem in range(1, SEMESTERS + 1) for index in range(subjects_per_semester)
+    ]
+    users = [teacher]
+    marks = []
+    for index in range(students):
+        semester = rng.randint(1, SEMESTERS)
+        student = {"id": str(uuid.uuid4()), "name": f"Bench Student {index}", "email": None,
+                   "student_id": f"BN{index:06d}", "role": "student", "department": DEPARTMENT,
+                   "semester": semester, "created_at": now}
+        users.append(student)
+        # Full marks for every semester the student has completed
+        for subject in subjects:
+            if subject["semester"] <= semester:
+                marks.append({
+                    "student_id": student["id"], "subject_id": subject["id"], "semester": subject["semester"],
+                    "internal1": round(rng.uniform(10, 40), 1), "internal2": round(rng.uniform(10, 40), 1),
+                    "internal3": round(rng.uniform(10, 40), 1), "final_exam": round(rng.uniform(25, 100), 1),
+                    "id": str(uuid.uuid4()), "updated_at": now,
+                })
+    return users, subjects, marks
+
+
+async def seed(db, args, rng: random.Random):
+    from gpa import rebuild_student_gpa
+    from indexes import ensure_indexes
+
+    await db.client.drop_database(db.name)
+    await ensure_indexes(db)
+    users, subjects, marks = synthetic_department(args.students, args.subjects_per_semester, rng)
+    await db.users.insert_many(users)
+    await db.subjects.insert_many(subjects)
+    for start in range(0, len(marks), 10000):
+        await db.marks.insert_many(marks[start:start + 10000], ordered=False)
+    students = [user for user in users if user["role"] == "student"]
+    for start in range(0, len(students), 500):
+        await rebuild_student_gpa(db, students[start:start + 500])
+    print(f"Seeded {len(students)} students, {len(subjects)} subjects, {len(marks)} marks into {db.name}")
+
+
+# Scenarios: each returns (endpoint label, method, url, json body, token)
+def marks_entry(ctx, rng: random.Random):
+    student = rng.choice(ctx["students"])
+    subject = rng.choice(ctx["subjects"])
+    body = {"student_id": student["id"], "subject_id": subject["id"], "semester": subject["semester"],
+            "internal1": round(rng.uniform(10, 40), 1), "internal2": round(rng.uniform(10, 40), 1),
+            "internal3": round(rng.uniform(10, 40), 1), "final_exam": round(rng.uniform(25, 100), 1)}
+    return "POST /api/marks", "POST", "/api/marks", body, ctx["teacher_token"]
+
+
+def dashboard_storm(ctx, rng: random.Random):
+    student = rng.choice(ctx["students"])
+    return ("GET /api/dashboard/student/{student_id}", "GET", f"/api/dashboard/student/{student['student_id']}",
+            None, ctx["student_tokens"][student["id"]])
+
+
+def catalog(ctx, rng: random.Random):
+    roll = rng.random()
+    if roll < 0.6:
+        return ("GET /api/subjects", "GET",
+                f"/api/subjects?department={DEPARTMENT}&semester={rng.randint(1, SEMESTERS)}", None, None)
+    if roll < 0.9:
+        return ("GET /api/students", "GET", f"/api/students?department={DEPARTMENT}&limit=100", None,
+                ctx["teacher_token"])
+    subject = rng.choice(ctx["subjects"])
+    return ("GET /api/marks/subject/{subject_id}", "GET", f"/api/marks/subject/{subject['id']}?limit=100", None,
+            ctx["teacher_token"])
+
+
+SCENARIOS = {"marks_entry": marks_entry, "dashboard_storm": dashboard_storm, "catalog": catalog}
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, ctx: dict, args, rng: random.Random) -> dict:
+    make_request = SCENARIOS[name]
+    samples = {}
+    deadline = time.perf_counter() + args.duration
+
+    async def worker(worker_rng: random.Random):
+        while time.perf_counter() < deadline:
+            label, method, url, body, token = make_request(ctx, worker_rng)
+            headers = {"Authorization": f"Bearer {token}"} if token else {}
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body, headers=headers)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies, errors = samples.setdefault(label, ([], [0]))
+            latencies.append(time.perf_counter() - started)
+            errors[0] += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(random.Random(rng.random())) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for label, (latencies, errors) in samples.items():
+        values = np.array(latencies) * 1000
+        results[label] = {
+            "requests": len(latencies),
+            "errors": errors[0],
+            "rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(float(np.percentile(values, 50)), 2),
+            "p95_ms": round(float(np.percentile(values, 95)), 2),
+            "p99_ms": round(float(np.percentile(values, 99)), 2),
+        }
+    return results
+
+
+def print_results(results: dict):
+    print(f"{'scenario':<16} {'endpoint':<42} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for scenario, endpoints in results.items():
+        for label, stats in endpoints.items():
+            print(f"{scenario:<16} {label:<42} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+                  f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    baseline = json.loads(Path(baseline_path).read_text())
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta'].get('commit')})")
+    ok = True
+    for scenario, endpoints in results.items():
+        for label, stats in endpoints.items():
+            before = baseline["results"].get(scenario, {}).get(label)
+            if not before:
+                continue
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0.0
+            rps_change = (stats["rps"] - before["rps"]) / before["rps"] * 100 if before["rps"] else 0.0
+            regressed = change > threshold
+            ok &= not regressed
+            print(f"  {'REGRESSION' if regressed else 'ok':<10} {scenario:<16} {label:<42} "
+                  f"p95 {before['p95_ms']} -> {stats['p95_ms']} ms ({change:+.1f}%), rps {rps_change:+.1f}%")
+    return ok
+
+
+async def main(args) -> int:
+    rng = random.Random(args.seed)
+    load_dotenv(BENCH_DIR.parent / ".env")
+    os.environ["DB_NAME"] = args.db_name or f"{os.environ.get('DB_NAME', 'marks')}{SCRATCH_SUFFIX}"
+    scenarios = args.scenario or list(SCENARIOS)
+    if not os.environ["DB_NAME"].endswith(SCRATCH_SUFFIX):
+        # Seeding starts with drop_database and marks_entry overwrites marks; never point either at a real database
+        if not (args.skip_seed and args.keep_data):
+            print(f"Refusing to seed or drop {os.environ['DB_NAME']!r}: scratch databases must end in "
+                  f"{SCRATCH_SUFFIX!r} (or pass --skip-seed --keep-data)", file=sys.stderr)
+            return 2
+        if "marks_entry" in scenarios:
+            print(f"Refusing to run marks_entry against {os.environ['DB_NAME']!r}: it writes marks; "
+                  "choose read scenarios with --scenario", file=sys.stderr)
+            return 2
+    backend_dir = str(BENCH_DIR.parent)
+    if backend_dir not in sys.path:
+        sys.path.insert(0, backend_dir)
+    import server
+
+    client = server.create_mongo_client()
+    db = client[os.environ["DB_NAME"]]
+    if not args.skip_seed:
+        await seed(db, args, rng)
+    else:
+        await server.ensure_indexes(db, drop_stale=False)
+
+    users = await db.users.find({"department": DEPARTMENT}, {"_id": 0}).to_list(None)
+    students = [user for user in users if user["role"] == "student"]
+    teacher = next((user for user in users if user["role"] == "teacher"), None)
+    if teacher is None:
+        print(f"No {DEPARTMENT} teacher in {db.name!r}; seed it first (run without --skip-seed)", file=sys.stderr)
+        client.close()
+        return 2
+    ctx = {
+        "students": students,
+        "subjects": await db.subjects.find({"department": DEPARTMENT}, {"_id": 0}).to_list(None),
+        "teacher_token": server.create_access_token({"sub": teacher["id"], "role": "teacher"}),
+        "student_tokens": {s["id"]: server.create_access_token({"sub": s["id"], "role": "student"}) for s in students},
+    }
+
+    if args.base_url:
+        transport, base_url = None, args.base_url
+        serving = contextlib.nullcontext()
+    else:
+        # ASGITransport does not run lifespans; the app starts its job queue on our client
+        app = server.create_app(client, db.name)
+        transport, base_url = httpx.ASGITransport(app=app), "http://bench"
+        serving = app.router.lifespan_context(app)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    results = {}
+    try:
+        async with serving, httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits,
+                                              timeout=30) as http:
+            for name in scenarios:
+                print(f"Running {name} for {args.duration:.0f}s with {args.concurrency} clients...")
+                results[name] = await run_scenario(http, name, ctx, args, rng)
+    finally:
+        if not args.keep_data:
+            await client.drop_database(db.name)
+        client.close()
+
+    print()
+    print_results(results)
+
+    if args.save_baseline is not None:
+        commit = git_commit()
+        path = Path(args.save_baseline) if args.save_baseline else BASELINE_DIR / f"{commit}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        meta = {"commit": commit, "created_at": datetime.now(timezone.utc).isoformat(),
+                "params": {key: value for key, value in vars(args).items()
+                           if key in ("students", "subjects_per_semester", "concurrency", "duration", "seed")}}
+        path.write_text(json.dumps({"meta": meta, "results": results}, indent=2) + "\n")
+        print(f"\nBaseline written to {path}")
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
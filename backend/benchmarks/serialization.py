@@ -0,0 +1,95 @@
+"""Serialization CPU per 1000 rows: FastAPI's default paths vs the orjson fast path.
+
+    cd backend && python -m benchmarks.serialization [--rows 1000] [--repeat 200]
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from serialization import dumps
+
+# Importing server builds the app but opens no MongoDB connection
+from server import Marks, Subject
+
+
+def subject_rows(count: int) -> List[dict]:
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "name": f"Subject {index}",
+            "code": f"SUB{index:04d}",
+            "semester": 1 + index % 8,
+            "credits": 1 + index % 5,
+            "department": "AI/ML",
+            "created_at": datetime.now(timezone.utc),
+        }
+        for index in range(count)
+    ]
+
+
+def marks_rows(count: int) -> List[dict]:
+    return [
+        {
+            "student_id": str(uuid.uuid4()),
+            "subject_id": str(uuid.uuid4()),
+            "semester": 1 + index % 8,
+            "internal1": 31.5,
+            "internal2": 28.0,
+            "internal3": None,
+            "final_exam": 40.0 + index % 60,
+            "id": str(uuid.uuid4()),
+            "updated_at": datetime.now(timezone.utc),
+        }
+        for index in range(count)
+    ]
+
+
+def cpu_ms(fn, repeat: int) -> float:
+    """Mean process CPU milliseconds per call"""
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    subjects = subject_rows(args.rows)
+    marks = marks_rows(args.rows)
+    subject_list = TypeAdapter(List[Subject])
+    marks_list = TypeAdapter(List[Marks])
+
+    cases = [
+        # What FastAPI does for response_model=List[Subject]: validate, dump to JSON types, json.dumps
+        ("subjects: response_model validation",
+         lambda: json.dumps(subject_list.dump_python(subject_list.validate_python(subjects), mode="json")).encode()),
+        ("subjects: jsonable_encoder", lambda: json.dumps(jsonable_encoder(subjects)).encode()),
+        ("subjects: orjson fast path", lambda: dumps({"items": subjects, "next_cursor": None})),
+        ("marks: response_model validation",
+         lambda: json.dumps(marks_list.dump_python(marks_list.validate_python(marks), mode="json")).encode()),
+        ("marks: jsonable_encoder", lambda: json.dumps(jsonable_encoder(marks)).encode()),
+        ("marks: orjson fast path", lambda: dumps({"items": marks, "next_cursor": None})),
+    ]
+
+    print(f"CPU per response of {args.rows} rows (mean of {args.repeat} runs)")
+    baseline = {}
+    for name, fn in cases:
+        kind = name.split(":")[0]
+        elapsed = cpu_ms(fn, args.repeat)
+        baseline.setdefault(kind, elapsed)
+        print(f"  {name:<40} {elapsed:8.3f} ms   {baseline[kind] / elapsed:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
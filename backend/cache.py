@@ -0,0 +1,103 @@
+"""Read-through caches for rarely changing catalog data.
+
+Entries are tagged with a per-namespace version kept in the `cache_versions`
+collection. Writers bump the version; every worker re-reads it at most once
+per `check_interval` seconds, so caches stay coherent across uvicorn workers
+without a message bus. The version also doubles as the ETag seed. Versions
+and entries are kept per database, so apps on different databases can share
+a process.
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+MISSING = object()
+
+
+class MemoryBackend:
+    """In-process LRU store with per-entry TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class VersionedCache:
+    """Read-through cache invalidated by bumping a version document in MongoDB"""
+
+    def __init__(self, namespace: str, backend=None, check_interval: float = 1.0):
+        self.namespace = namespace
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        # database name -> (version, monotonic time it was read)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+
+    async def version(self, db) -> int:
+        """Current namespace version, re-read from MongoDB at most every `check_interval` seconds"""
+        now = time.monotonic()
+        version, checked_at = self._versions.get(db.name, (0, float("-inf")))
+        if now - checked_at >= self.check_interval:
+            doc = await db.cache_versions.find_one({"_id": self.namespace})
+            version = doc["version"] if doc else 0
+            self._versions[db.name] = (version, now)
+        return version
+
+    async def get_or_load(self, db, key: Hashable, loader: Callable[[], Awaitable[Any]], version: Optional[int] = None) -> Any:
+        if version is None:
+            version = await self.version(db)
+        value = self.backend.get((db.name, version, key))
+        if value is not MISSING:
+            self.hits += 1
+            return value
+        self.misses += 1
+        value = await loader()
+        self.backend.set((db.name, version, key), value)
+        return value
+
+    async def invalidate(self, db) -> int:
+        """Bump the namespace version for every worker and drop this worker's entries now"""
+        doc = await db.cache_versions.find_one_and_update(
+            {"_id": self.namespace},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._versions[db.name] = (doc["version"], time.monotonic())
+        self.backend.clear()
+        return doc["version"]
+
+    def etag(self, version: int, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return f'"{self.namespace}-{version}-{digest}"'
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import os
+from datetime import timezone
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+logger = logging.getLogger(__name__)
+
+
+def pool_settings() -> dict:
+    """Connection pool and wire options from the environment; unset ones keep the driver defaults
+
+    MONGO_MAX_POOL_SIZE          connections per server, per worker process (driver default 100)
+    MONGO_MIN_POOL_SIZE          connections kept open even when idle (default 0)
+    MONGO_WAIT_QUEUE_TIMEOUT_MS  how long a request may wait for a free connection
+    MONGO_MAX_IDLE_TIME_MS       idle connections older than this are closed
+    MONGO_COMPRESSORS            e.g. "zstd,snappy"; needs the zstandard / python-snappy packages,
+                                 the driver warns and skips any that are not installed
+    """
+    settings = {}
+    for variable, option in (
+        ('MONGO_MAX_POOL_SIZE', 'maxPoolSize'),
+        ('MONGO_MIN_POOL_SIZE', 'minPoolSize'),
+        ('MONGO_WAIT_QUEUE_TIMEOUT_MS', 'waitQueueTimeoutMS'),
+        ('MONGO_MAX_IDLE_TIME_MS', 'maxIdleTimeMS'),
+    ):
+        if os.environ.get(variable):
+            settings[option] = int(os.environ[variable])
+    if os.environ.get('MONGO_COMPRESSORS'):
+        settings['compressors'] = os.environ['MONGO_COMPRESSORS']
+    return settings
+
+
+def create_client(mongo_url: str = None, event_listeners=None) -> AsyncIOMotorClient:
+    """Motor client shared by the API and the maintenance commands.
+
+    Timestamps are stored as native BSON dates and decoded as tz-aware UTC
+    datetimes, so handlers never convert them by hand. The client connects
+    lazily; see `warm_pool` for opening connections ahead of traffic.
+    """
+    return AsyncIOMotorClient(
+        mongo_url or os.environ['MONGO_URL'],
+        tz_aware=True,
+        tzinfo=timezone.utc,
+        event_listeners=event_listeners or [],
+        **pool_settings()
+    )
+
+
+async def warm_pool(client: AsyncIOMotorClient, connections: int) -> None:
+    """Open `connections` pooled connections now, so a fresh worker's first requests skip the handshakes"""
+    # Concurrent pings each need their own connection
+    results = await asyncio.gather(
+        *(client.admin.command("ping") for _ in range(max(1, connections))), return_exceptions=True
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning("Could not warm %d of %d MongoDB connections: %s", len(failures), len(results), failures[0])
@@ -0,0 +1,62 @@
+"""Request deadlines for MongoDB work.
+
+`DeadlineMiddleware` runs each API request inside `pymongo.timeout(seconds)`.
+PyMongo keeps the deadline in a context variable (Motor copies it onto its
+executor threads) and sends every command with `maxTimeMS` set to the time
+remaining, failing at once when none is left, so server selection, pool
+checkout and the queries themselves all share one budget. A request whose
+database work runs out of time is answered with a 503 and Retry-After rather
+than tying up a worker. Long-running endpoints (exports, uploads, streams)
+are exempted by path prefix.
+"""
+import logging
+from typing import Sequence
+
+import orjson
+import pymongo
+from pymongo.errors import PyMongoError
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "request_deadline_exceeded_total", "Requests answered 503 because their MongoDB deadline ran out", ("route",))
+
+
+class DeadlineMiddleware:
+    def __init__(self, app, seconds: float, exempt_prefixes: Sequence[str] = (), retry_after: int = 1):
+        self.app = app
+        self.seconds = seconds
+        self.exempt_prefixes = tuple(exempt_prefixes)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.seconds or scope["path"].startswith(self.exempt_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            with pymongo.timeout(self.seconds):
+                await self.app(scope, receive, send_tracking)
+        except PyMongoError as e:
+            if not e.timeout or started:
+                raise
+            route = getattr(scope.get("route"), "path", "unmatched")
+            DEADLINE_EXCEEDED.inc(route)
+            logger.warning("%s %s ran out of its %.1fs database deadline: %s", scope["method"], route, self.seconds, e)
+            body = orjson.dumps({"detail": "The database did not answer in time, please retry"})
+            await send({"type": "http.response.start", "status": 503, "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ]})
+            await send({"type": "http.response.body", "body": body})
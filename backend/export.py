@@ -0,0 +1,192 @@
+"""Streaming NDJSON/CSV exports for the exam office.
+
+Rows are produced straight off Motor cursors and flushed in batches, so an
+export holds at most `batch_size` documents in memory no matter how large it
+is.
+"""
+import csv
+import io
+from typing import AsyncIterator, Iterable, List, Optional
+
+from gpa import build_semester_data, rebuild_student_gpa, semester_data_from_gpa
+from grading import get_scheme
+from serialization import dumps
+
+MARKS_COLUMNS = ["id", "student_id", "subject_id", "semester", "internal1", "internal2", "internal3",
+                 "final_exam", "updated_at"]
+TRANSCRIPT_COLUMNS = ["student_id", "name", "department", "semester", "subject_code", "subject_name",
+                      "credits", "final_exam", "grade_point", "sgpa", "total_credits", "cgpa"]
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+class RowEncoder:
+    """Encode dict rows as NDJSON lines (orjson, like the API responses) or CSV records"""
+
+    def __init__(self, format: str, columns: List[str]):
+        self.format = format
+        self.columns = columns
+
+    def header(self) -> bytes:
+        if self.format != "csv":
+            return b""
+        return self.encode_csv([dict(zip(self.columns, self.columns))])
+
+    def encode(self, rows: Iterable[dict]) -> bytes:
+        if self.format == "csv":
+            return self.encode_csv(rows)
+        return b"".join(dumps(row) + b"\n" for row in rows)
+
+    def encode_csv(self, rows: Iterable[dict]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, extrasaction="ignore")
+        writer.writerows(rows)
+        return buffer.getvalue().encode()
+
+
+async def _batched(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for doc in cursor.batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def marks_query(db, subject_id: Optional[str], semester: Optional[int], department: Optional[str]) -> dict:
+    """Translate export filters into a marks query (departments resolve to their subject ids)"""
+    query = {}
+    if subject_id:
+        query["subject_id"] = subject_id
+    elif department:
+        subject_query = {"department": department}
+        if semester:
+            subject_query["semester"] = semester
+        query["subject_id"] = {"$in": [s["id"] async for s in db.subjects.find(subject_query, {"_id": 0, "id": 1})]}
+    if semester:
+        query["semester"] = semester
+    return query
+
+
+async def stream_marks(db, query: dict, format: str, batch_size: int) -> AsyncIterator[bytes]:
+    encoder = RowEncoder(format, MARKS_COLUMNS)
+    yield encoder.header()
+    cursor = db.marks.find(query, {"_id": 0}).sort("_id", 1)
+    async for batch in _batched(cursor, batch_size):
+        yield encoder.encode(batch)
+
+
+def _transcript(student: dict, gpa_doc: dict) -> dict:
+    semester_data, cgpa = semester_data_from_gpa(gpa_doc)
+    return {
+        "student": {key: student.get(key) for key in ("id", "student_id", "name", "department", "semester")},
+        "cgpa": cgpa,
+        "semesters": [
+            {
+                "semester": info["semester"],
+                "sgpa": info["sgpa"],
+                "total_credits": info["total_credits"],
+                "subjects": [
+                    {
+                        "subject_id": item["subject"]["id"],
+                        "code": item["subject"]["code"],
+                        "name": item["subject"]["name"],
+                        "credits": item["subject"]["credits"],
+                        "final_exam": item["marks"]["final_exam"],
+                        "grade_point": item["grade_point"],
+                    }
+                    for item in info["subjects"]
+                ],
+            }
+            for info in semester_data.values() if info["subjects"]
+        ],
+    }
+
+
+def _transcript_rows(transcript: dict) -> Iterable[dict]:
+    student = transcript["student"]
+    for semester in transcript["semesters"]:
+        for subject in semester["subjects"]:
+            yield {
+                "student_id": student["student_id"],
+                "name": student["name"],
+                "department": student["department"],
+                "semester": semester["semester"],
+                "subject_code": subject["code"],
+                "subject_name": subject["name"],
+                "credits": subject["credits"],
+                "final_exam": subject["final_exam"],
+                "grade_point": subject["grade_point"],
+                "sgpa": semester["sgpa"],
+                "total_credits": semester["total_credits"],
+                "cgpa": transcript["cgpa"],
+            }
+
+
+async def stream_transcripts(db, department: str, semester: Optional[int], format: str, batch_size: int) -> AsyncIterator[bytes]:
+    """One NDJSON transcript per student, or one CSV row per graded subject"""
+    encoder = RowEncoder(format, TRANSCRIPT_COLUMNS)
+    yield encoder.header()
+
+    query = {"role": "student", "department": department}
+    if semester:
+        query["semester"] = semester
+    cursor = db.users.find(query, {"_id": 0, "password_hash": 0, "search_tokens": 0}).sort("_id", 1)
+    async for students in _batched(cursor, batch_size):
+        gpa_docs = {
+            doc["student_id"]: doc
+            async for doc in db.student_gpa.find({"student_id": {"$in": [s["id"] for s in students]}}, {"_id": 0})
+        }
+        missing = [student for student in students if student["id"] not in gpa_docs]
+        for doc in await rebuild_student_gpa(db, missing):
+            gpa_docs[doc["student_id"]] = doc
+
+        transcripts = [_transcript(student, gpa_docs[student["id"]]) for student in students]
+        if format == "csv":
+            yield encoder.encode(row for transcript in transcripts for row in _transcript_rows(transcript))
+        else:
+            yield encoder.encode(transcripts)
+
+
+async def stream_cohort_dashboards(db, department: str, semester: Optional[int], roll_numbers: Optional[List[str]],
+                                   batch_size: int) -> AsyncIterator[bytes]:
+    """Student dashboards for a whole cohort as NDJSON, from one subjects query and one marks query
+
+    `roll_numbers` limits the stream to those students; only None means the whole cohort.
+    """
+    query = {"role": "student", "department": department}
+    if semester:
+        query["semester"] = semester
+    if roll_numbers is not None:
+        query["student_id"] = {"$in": roll_numbers}
+    students = await db.users.find(query, {"_id": 0, "password_hash": 0, "search_tokens": 0}).to_list(None)
+    if not students:
+        return
+    students.sort(key=lambda student: student["id"])
+    subjects = await db.subjects.find({"department": department}).sort("_id", 1).to_list(None)
+    scheme = await get_scheme(db, department)
+
+    def dashboard(student: dict, marks_list: List[dict]) -> bytes:
+        semester_data, cgpa = build_semester_data(marks_list, subjects, scheme)
+        return dumps({"student": student, "semester_data": semester_data, "cgpa": cgpa}) + b"\n"
+
+    # Marks come back grouped by student in the same order as `students`, so
+    # each student's dashboard is emitted as soon as the cursor moves past them.
+    cursor = db.marks.find({"student_id": {"$in": [student["id"] for student in students]}}, {"_id": 0})
+    cursor = cursor.sort([("student_id", 1), ("subject_id", 1)]).batch_size(1000)
+    lines, student_marks, position = [], [], 0
+    async for mark_entry in cursor:
+        while students[position]["id"] != mark_entry["student_id"]:
+            lines.append(dashboard(students[position], student_marks))
+            student_marks, position = [], position + 1
+            if len(lines) >= batch_size:
+                yield b"".join(lines)
+                lines = []
+        student_marks.append(mark_entry)
+
+    for student in students[position:]:
+        lines.append(dashboard(student, student_marks))
+        student_marks = []
+    yield b"".join(lines)
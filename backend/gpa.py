@@ -0,0 +1,337 @@
+"""SGPA/CGPA calculation and the materialized `student_gpa` collection.
+
+One document per student holds, for every semester, the subjects that count
+towards SGPA:
+
+    {
+        "student_id": <users.id>,
+        "roll_number": <users.student_id>,
+        "department": "AI/ML",
+        "data_version": 7,
+        "semesters": {
+            "3": {
+                "entries": {<subject id>: {"subject": {...}, "marks": {...},
+                                           "grade_point": 9.0, "credits": 4,
+                                           "order": <subject _id>}},
+            },
+        },
+    }
+
+Marks writes and subject deletions patch single entries in one update, so
+the dashboard never has to join marks onto subjects again (a patch carrying
+marks older than the stored entry's falls back to a rebuild); SGPA/CGPA are
+summed from the entries on read. Grade points follow the department's grading
+scheme (see grading.py); changing a scheme rebuilds the department with
+`rebuild_department_gpa`.
+
+`data_version` goes up with every change to the student's marks or GPA
+entries (a missing field counts as 0), so conditional GETs can answer 304
+from this document alone. Rebuilds only replace a document whose version is
+still the one they read, so they never overwrite a concurrent entry patch.
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from grading import DEFAULT_SCHEME, GradingScheme, get_scheme, get_schemes
+
+logger = logging.getLogger(__name__)
+
+SEMESTERS = range(1, 9)
+DUPLICATE_KEY = 11000
+
+
+def summarize(entries_by_semester: Dict[int, list]):
+    """Turn (subject, marks, grade_point) triples per semester into semester_data and CGPA"""
+    semester_data = {}
+
+    for sem in SEMESTERS:
+        total_credits = 0
+        total_grade_points = 0
+        subjects_with_marks = []
+
+        for subject, mark_entry, grade_point in entries_by_semester.get(sem, []):
+            total_credits += subject["credits"]
+            total_grade_points += grade_point * subject["credits"]
+
+            subjects_with_marks.append({
+                "subject": subject,
+                "marks": mark_entry,
+                "grade_point": grade_point
+            })
+
+        sgpa = total_grade_points / total_credits if total_credits > 0 else 0
+
+        semester_data[f"semester_{sem}"] = {
+            "semester": sem,
+            "sgpa": round(sgpa, 2),
+            "subjects": subjects_with_marks,
+            "total_credits": total_credits
+        }
+
+    # Calculate overall CGPA
+    total_credits_all = 0
+    total_grade_points_all = 0
+
+    for sem_key, sem_info in semester_data.items():
+        total_credits_all += sem_info["total_credits"]
+        total_grade_points_all += sem_info["sgpa"] * sem_info["total_credits"]
+
+    cgpa = total_grade_points_all / total_credits_all if total_credits_all > 0 else 0
+
+    return semester_data, round(cgpa, 2)
+
+
+def graded_pairs(marks_list: List[dict], subjects: List[dict]) -> List[tuple]:
+    """(subject, mark) pairs that count towards SGPA, in subject order"""
+    # First mark per (semester, subject) wins, as with the original next(...) scan
+    marks_by_subject = {}
+    for mark_entry in marks_list:
+        marks_by_subject.setdefault((mark_entry["semester"], mark_entry["subject_id"]), mark_entry)
+
+    pairs = []
+    for subject in subjects:
+        mark_entry = marks_by_subject.get((subject["semester"], subject["id"]))
+        if subject["semester"] in SEMESTERS and mark_entry and mark_entry.get("final_exam") is not None:
+            pairs.append((subject, mark_entry))
+    return pairs
+
+
+def build_semester_data(marks_list: List[dict], subjects: List[dict], scheme: GradingScheme = DEFAULT_SCHEME):
+    """Join a student's marks onto their department's subjects and compute SGPA/CGPA from scratch"""
+    pairs = graded_pairs(marks_list, subjects)
+    grade_points = scheme.grade_points(mark_entry for _, mark_entry in pairs)
+
+    entries_by_semester = {}
+    for (subject, mark_entry), grade_point in zip(pairs, grade_points):
+        entries_by_semester.setdefault(subject["semester"], []).append((_public(subject), mark_entry, grade_point))
+
+    return summarize(entries_by_semester)
+
+
+def semester_data_from_gpa(gpa_doc: dict):
+    """Compute semester_data and CGPA from a materialized student_gpa document"""
+    entries_by_semester = {}
+    for sem in SEMESTERS:
+        entries = (gpa_doc.get("semesters", {}).get(str(sem)) or {}).get("entries") or {}
+        ordered = sorted(entries.values(), key=lambda entry: entry["order"])
+        entries_by_semester[sem] = [(entry["subject"], entry["marks"], entry["grade_point"]) for entry in ordered]
+    return summarize(entries_by_semester)
+
+
+def _public(doc: dict) -> dict:
+    return {key: value for key, value in doc.items() if key != "_id"}
+
+
+def _entry(marks_doc: dict, subject: dict, grade_point: float) -> dict:
+    return {
+        "subject": _public(subject),
+        "marks": _public(marks_doc),
+        "grade_point": grade_point,
+        "credits": subject["credits"],
+        "order": subject["_id"],
+    }
+
+
+def gpa_entry(marks_doc: dict, subject: dict, scheme: GradingScheme = DEFAULT_SCHEME) -> Optional[dict]:
+    """The materialized entry for one mark, or None when it does not count towards SGPA"""
+    if subject["semester"] not in SEMESTERS:
+        return None
+    if marks_doc.get("semester") != subject["semester"] or marks_doc.get("final_exam") is None:
+        return None
+    return _entry(marks_doc, subject, scheme.grade_point(marks_doc))
+
+
+def empty_gpa_doc(student: dict) -> dict:
+    return {"student_id": student["id"], "roll_number": student.get("student_id"), "department": student["department"],
+            "semesters": {}}
+
+
+def data_version(doc: dict) -> int:
+    return doc.get("data_version", 0)
+
+
+async def get_data_version(db, query: dict) -> Optional[int]:
+    """The data version of the student_gpa document matching `query`, or None if there is none"""
+    doc = await db.student_gpa.find_one(query, {"_id": 0, "data_version": 1})
+    return None if doc is None else data_version(doc)
+
+
+async def bump_data_versions(db, student_ids: Iterable[str]) -> None:
+    student_ids = list(set(student_ids))
+    if student_ids:
+        await db.student_gpa.update_many({"student_id": {"$in": student_ids}}, {"$inc": {"data_version": 1}})
+
+
+def materialize(student: dict, marks_list: List[dict], subjects: List[dict],
+                scheme: GradingScheme = DEFAULT_SCHEME) -> dict:
+    """Build a complete student_gpa document from the student's marks and department subjects"""
+    doc = empty_gpa_doc(student)
+    pairs = graded_pairs(marks_list, subjects)
+    grade_points = scheme.grade_points(mark_entry for _, mark_entry in pairs)
+
+    for (subject, mark_entry), grade_point in zip(pairs, grade_points):
+        entry = _entry(mark_entry, subject, grade_point)
+        doc["semesters"].setdefault(str(subject["semester"]), {"entries": {}})["entries"][subject["id"]] = entry
+    return doc
+
+
+async def apply_marks_to_gpa(db, marks_doc: dict, subject: Optional[dict],
+                             scheme: Optional[GradingScheme] = None) -> None:
+    """Patch one student's materialized GPA after their marks for `subject` changed (one update)"""
+    if subject is None:
+        # Marks for an unknown subject never count towards SGPA, but they are still the student's marks
+        await bump_data_versions(db, [marks_doc["student_id"]])
+        return
+
+    sem = str(subject["semester"])
+    path = f"semesters.{sem}.entries.{subject['id']}"
+    if scheme is None:
+        scheme = await get_scheme(db, subject["department"])
+    entry = gpa_entry(marks_doc, subject, scheme)
+    update = {"$set": {path: entry}} if entry else {"$unset": {path: ""}}
+    update["$inc"] = {"data_version": 1}
+
+    # Only students of the subject's department have this subject in their SGPA. Concurrent
+    # saves can patch out of order, so an entry from newer marks is never replaced by older ones
+    result = await db.student_gpa.update_one(
+        {"student_id": marks_doc["student_id"], "department": subject["department"],
+         f"{path}.marks.updated_at": {"$not": {"$gt": marks_doc["updated_at"]}}},
+        update
+    )
+    if result.matched_count == 0:
+        # Newer entry, other department or no document yet: recompute from the stored marks
+        await refresh_students_gpa(db, [marks_doc["student_id"]])
+
+
+async def remove_subject_from_gpa(db, subject: dict) -> int:
+    """Drop a deleted subject's entries from every affected student; returns students touched"""
+    path = f"semesters.{subject['semester']}.entries.{subject['id']}"
+    result = await db.student_gpa.update_many(
+        {"department": subject["department"], path: {"$exists": True}},
+        {"$unset": {path: ""}, "$inc": {"data_version": 1}}
+    )
+    return result.modified_count
+
+
+async def load_gpa_inputs(db, students: List[dict]):
+    """Fetch marks per student, subjects per department (in creation order) and grading schemes for a batch"""
+    student_ids = [student["id"] for student in students]
+    departments = list({student["department"] for student in students})
+
+    marks_by_student = {student_id: [] for student_id in student_ids}
+    async for mark_entry in db.marks.find({"student_id": {"$in": student_ids}}, {"_id": 0}):
+        marks_by_student[mark_entry["student_id"]].append(mark_entry)
+
+    subjects_by_department = {department: [] for department in departments}
+    async for subject in db.subjects.find({"department": {"$in": departments}}).sort("_id", 1):
+        subjects_by_department[subject["department"]].append(subject)
+
+    return marks_by_student, subjects_by_department, await get_schemes(db, departments)
+
+
+async def rebuild_student_gpa(db, students: List[dict], attempts: int = 3) -> List[dict]:
+    """Recompute and store the student_gpa documents for a batch of students
+
+    Each document is replaced only if its data_version is still the one read
+    before the marks; students patched in between are recomputed, up to
+    `attempts` times.
+    """
+    docs = {}
+    pending = students
+    for _ in range(attempts):
+        if not pending:
+            break
+        conflicts = await _rebuild_once(db, pending, docs)
+        pending = [student for student in pending if student["id"] in conflicts]
+    if pending:
+        logger.warning("Gave up rebuilding the GPA of %d students changed concurrently", len(pending))
+    return [docs[student["id"]] for student in students]
+
+
+async def _rebuild_once(db, students: List[dict], docs: Dict[str, dict]) -> set:
+    # Versions first: a patch landing after this read makes the conditional write below miss
+    versions = {
+        doc["student_id"]: doc.get("data_version")
+        async for doc in db.student_gpa.find(
+            {"student_id": {"$in": [student["id"] for student in students]}},
+            {"_id": 0, "student_id": 1, "data_version": 1}
+        )
+    }
+    marks_by_student, subjects_by_department, schemes = await load_gpa_inputs(db, students)
+
+    operations = []
+    for student in students:
+        doc = materialize(student, marks_by_student[student["id"]], subjects_by_department[student["department"]],
+                          schemes[student["department"]])
+        docs[student["id"]] = doc
+        version = versions.get(student["id"])
+        # A document changed since the read fails the filter, and the upsert then hits student_id_unique
+        condition = {"data_version": version} if version is not None else {"data_version": {"$exists": False}}
+        operations.append(UpdateOne(
+            {"student_id": student["id"], **condition},
+            # Replaces everything but data_version, which keeps counting up
+            {"$set": {key: value for key, value in doc.items() if key != "student_id"}, "$inc": {"data_version": 1}},
+            upsert=True
+        ))
+
+    try:
+        await db.student_gpa.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(error.get("code") != DUPLICATE_KEY for error in errors):
+            raise
+        return {students[error["index"]]["id"] for error in errors}
+    return set()
+
+
+async def refresh_students_gpa(db, student_ids: Iterable[str]) -> None:
+    """Rebuild the materialized GPA of the given students (by users.id)"""
+    students = await db.users.find(
+        {"id": {"$in": list(set(student_ids))}, "role": "student"}, {"_id": 0}
+    ).to_list(None)
+    await rebuild_student_gpa(db, students)
+
+
+async def rebuild_department_gpa(db, department: str, batch_size: int = 500, progress=None) -> int:
+    """Rebuild every student of a department (after its grading scheme changed); returns students rebuilt
+
+    `progress(done, total)` is awaited after every batch when given.
+    """
+    query = {"role": "student", "department": department}
+    total = await db.users.count_documents(query) if progress else None
+    rebuilt = 0
+    cursor = db.users.find(query, {"_id": 0, "password_hash": 0, "search_tokens": 0})
+    while True:
+        students = await cursor.to_list(batch_size)
+        if not students:
+            return rebuilt
+        await rebuild_student_gpa(db, students)
+        rebuilt += len(students)
+        if progress:
+            await progress(rebuilt, total)
+
+
+def canonical_dashboard(semester_data, cgpa) -> bytes:
+    return json.dumps({"semester_data": semester_data, "cgpa": cgpa}, default=str).encode()
+
+
+async def verify_student_gpa(db, students: List[dict]) -> List[str]:
+    """Compare stored documents with a from-scratch computation; returns the student ids that differ"""
+    marks_by_student, subjects_by_department, schemes = await load_gpa_inputs(db, students)
+    stored = {
+        doc["student_id"]: doc
+        async for doc in db.student_gpa.find({"student_id": {"$in": list(marks_by_student)}})
+    }
+
+    mismatched = []
+    for student in students:
+        expected = build_semester_data(marks_by_student[student["id"]], subjects_by_department[student["department"]],
+                                       schemes[student["department"]])
+        doc = stored.get(student["id"])
+        if doc is None or canonical_dashboard(*semester_data_from_gpa(doc)) != canonical_dashboard(*expected):
+            mismatched.append(student["id"])
+    return mismatched
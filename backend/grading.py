@@ -0,0 +1,194 @@
+"""Grading schemes: how a department turns marks into grade points.
+
+A scheme weights the mark components into a score, maps the score onto grade
+point bands and applies optional pass rules. Schemes live in the
+`grading_schemes` collection, one document per department:
+
+    {
+        "department": "AI/ML",
+        "weights": {"internal1": 0.1, "internal2": 0.1, "internal3": 0.1, "final_exam": 0.7},
+        "bands": [[90, 10.0], [80, 9.0], ...],   # (minimum score, grade point)
+        "fail_grade_point": 0.0,
+        "pass_final_exam": 35,                   # minimum final exam marks, or null
+        "pass_score": null,                      # minimum weighted score, or null
+    }
+
+Departments without a document use DEFAULT_SCHEME, which is the original
+banding of the final exam alone. Bands are compiled into sorted NumPy arrays
+so whole classes are graded with one `searchsorted` call.
+"""
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from cache import MemoryBackend, VersionedCache
+
+MARK_COMPONENTS = ("internal1", "internal2", "internal3", "final_exam")
+
+# (minimum marks, grade point), highest band first
+GRADE_BANDS = [
+    (90, 10.0),
+    (80, 9.0),
+    (70, 8.0),
+    (60, 7.0),
+    (50, 6.0),
+    (40, 5.0),
+]
+FAIL_GRADE_POINT = 0.0
+
+
+def calculate_grade_point(marks: float) -> float:
+    """Convert marks to 10-point grade scale"""
+    for minimum, grade_point in GRADE_BANDS:
+        if marks >= minimum:
+            return grade_point
+    return FAIL_GRADE_POINT
+
+
+class InvalidScheme(ValueError):
+    pass
+
+
+class GradingScheme:
+    def __init__(self, weights: Dict[str, float], bands: Sequence[Tuple[float, float]],
+                 fail_grade_point: float = FAIL_GRADE_POINT, pass_final_exam: Optional[float] = None,
+                 pass_score: Optional[float] = None):
+        unknown = set(weights) - set(MARK_COMPONENTS)
+        if unknown:
+            raise InvalidScheme(f"Unknown mark components: {', '.join(sorted(unknown))}")
+        if any(weight < 0 for weight in weights.values()) or not any(weights.values()):
+            raise InvalidScheme("Weights must be non-negative and not all zero")
+        if not bands:
+            raise InvalidScheme("At least one grade band is required")
+        minimums = [float(minimum) for minimum, _ in bands]
+        if len(set(minimums)) != len(minimums):
+            raise InvalidScheme("Grade band minimums must be distinct")
+
+        self.weights = {component: float(weights.get(component, 0.0)) for component in MARK_COMPONENTS}
+        # Zero weights are skipped everywhere so scalar, NumPy and MongoDB sums add the same terms
+        self._weighted = [(component, weight) for component, weight in self.weights.items() if weight]
+        # Highest band first, as in GRADE_BANDS
+        self.bands = sorted(((float(minimum), float(point)) for minimum, point in bands), reverse=True)
+        self.fail_grade_point = float(fail_grade_point)
+        self.pass_final_exam = pass_final_exam
+        self.pass_score = pass_score
+
+        # searchsorted(thresholds, score, side="right") counts the bands a score reaches
+        self._thresholds = np.array([minimum for minimum, _ in reversed(self.bands)])
+        self._points = np.array([self.fail_grade_point] + [point for _, point in reversed(self.bands)])
+        # Identifies the grading rules in cache keys of derived results
+        self.cache_key = (tuple(self._weighted), tuple(self.bands), self.fail_grade_point, pass_final_exam, pass_score)
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "GradingScheme":
+        return cls(doc["weights"], doc["bands"], doc.get("fail_grade_point", FAIL_GRADE_POINT),
+                   doc.get("pass_final_exam"), doc.get("pass_score"))
+
+    def to_doc(self) -> dict:
+        return {
+            "weights": dict(self.weights),
+            "bands": [list(band) for band in self.bands],
+            "fail_grade_point": self.fail_grade_point,
+            "pass_final_exam": self.pass_final_exam,
+            "pass_score": self.pass_score,
+        }
+
+    def weighted(self) -> List[Tuple[str, float]]:
+        return self._weighted
+
+    def score(self, marks_doc: dict) -> float:
+        total = 0.0
+        for component, weight in self._weighted:
+            total += weight * (marks_doc.get(component) or 0.0)
+        return total
+
+    def grade_point(self, marks_doc: dict) -> float:
+        """Grade one marks document (its final_exam must be present)"""
+        score = self.score(marks_doc)
+        if self._fails(marks_doc["final_exam"], score):
+            return self.fail_grade_point
+        for minimum, point in self.bands:
+            if score >= minimum:
+                return point
+        return self.fail_grade_point
+
+    def _fails(self, final_exam, score):
+        failed = False
+        if self.pass_final_exam is not None:
+            failed = failed | (final_exam < self.pass_final_exam)
+        if self.pass_score is not None:
+            failed = failed | (score < self.pass_score)
+        return failed
+
+    def scores(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Weighted scores of arrays of marks; missing components and NaNs count as zero"""
+        score = np.zeros(np.shape(columns["final_exam"]))
+        for component, weight in self._weighted:
+            values = columns.get(component)
+            if values is not None:
+                score += weight * np.nan_to_num(np.asarray(values, dtype=float), nan=0.0)
+        return score
+
+    def grade(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """Grade arrays of marks in one pass"""
+        final_exam = np.asarray(columns["final_exam"], dtype=float)
+        score = self.scores(columns)
+        points = self._points[np.searchsorted(self._thresholds, score, side="right")]
+        return np.where(self._fails(final_exam, score), self.fail_grade_point, points)
+
+    def grade_points(self, marks_docs: Iterable[dict]) -> List[float]:
+        """Grade point per marks document, as plain floats"""
+        return self.grade(mark_columns(marks_docs)).tolist()
+
+
+def mark_columns(marks_docs: Iterable[dict]) -> Dict[str, np.ndarray]:
+    """Marks documents as one float array per component (missing marks become NaN)"""
+    marks_docs = list(marks_docs)
+    return {
+        component: np.array([doc.get(component) for doc in marks_docs], dtype=float)
+        for component in MARK_COMPONENTS
+    }
+
+
+DEFAULT_SCHEME = GradingScheme({"final_exam": 1.0}, GRADE_BANDS, FAIL_GRADE_POINT)
+
+# Compiled schemes per department, coherent across workers through cache_versions
+schemes_cache = VersionedCache("grading_schemes", MemoryBackend(maxsize=256, ttl=300))
+
+
+async def get_scheme(db, department: str) -> GradingScheme:
+    async def load():
+        doc = await db.grading_schemes.find_one({"department": department}, {"_id": 0})
+        return GradingScheme.from_doc(doc) if doc else DEFAULT_SCHEME
+
+    return await schemes_cache.get_or_load(db, (db.name, department), load)
+
+
+async def get_subject_with_scheme(db, subject_id: str) -> Tuple[Optional[dict], GradingScheme]:
+    """A subject and its department's grading scheme in one round trip, for the marks write path"""
+    pipeline = [
+        {"$match": {"id": subject_id}},
+        {"$limit": 1},
+        {"$lookup": {"from": "grading_schemes", "localField": "department", "foreignField": "department",
+                     "as": "grading_scheme"}},
+    ]
+    docs = await db.subjects.aggregate(pipeline).to_list(1)
+    if not docs:
+        return None, DEFAULT_SCHEME
+    subject = docs[0]
+    schemes = subject.pop("grading_scheme")
+    return subject, GradingScheme.from_doc(schemes[0]) if schemes else DEFAULT_SCHEME
+
+
+async def get_schemes(db, departments: Iterable[str]) -> Dict[str, GradingScheme]:
+    return {department: await get_scheme(db, department) for department in set(departments)}
+
+
+async def save_scheme(db, department: str, scheme: GradingScheme) -> None:
+    await db.grading_schemes.update_one(
+        {"department": department},
+        {"$set": {**scheme.to_doc(), "updated_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    await schemes_cache.invalidate(db)
@@ -0,0 +1,194 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+INDEX_NOT_FOUND = 27
+
+# Unique indexes on optional fields only cover documents that actually carry a
+# value: students are stored with email=None and teachers with student_id=None.
+# `$gt: ""` (rather than `$type`) keeps plain equality lookups eligible for the
+# partial index.
+_HAS_EMAIL = {"email": {"$gt": ""}}
+_HAS_STUDENT_ID = {"student_id": {"$gt": ""}}
+
+# Every index the application relies on, per collection. Names are explicit so
+# reconciliation can tell our indexes apart from ones created by hand.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True,
+                   partialFilterExpression=_HAS_EMAIL),
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True,
+                   partialFilterExpression=_HAS_STUDENT_ID),
+        # List endpoints page by _id, so filters are followed by _id
+        IndexModel([("role", ASCENDING), ("department", ASCENDING), ("_id", ASCENDING)],
+                   name="role_department_page"),
+        IndexModel([("role", ASCENDING), ("department", ASCENDING), ("semester", ASCENDING), ("_id", ASCENDING)],
+                   name="role_department_semester_page"),
+        # Typeahead search (multikey on the token array)
+        IndexModel([("role", ASCENDING), ("search_tokens", ASCENDING), ("department", ASCENDING)],
+                   name="role_search_tokens"),
+    ],
+    "subjects": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("code", ASCENDING), ("semester", ASCENDING)], name="code_semester_unique", unique=True),
+        IndexModel([("department", ASCENDING), ("_id", ASCENDING)], name="department_page"),
+        IndexModel([("department", ASCENDING), ("semester", ASCENDING), ("_id", ASCENDING)],
+                   name="department_semester_page"),
+        IndexModel([("semester", ASCENDING), ("_id", ASCENDING)], name="semester_page"),
+    ],
+    "marks": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("student_id", ASCENDING), ("subject_id", ASCENDING)],
+                   name="student_subject_unique", unique=True),
+        IndexModel([("subject_id", ASCENDING), ("_id", ASCENDING)], name="subject_page"),
+        IndexModel([("student_id", ASCENDING), ("_id", ASCENDING)], name="student_page"),
+        # Marks exports filtered by semester alone
+        IndexModel([("semester", ASCENDING), ("_id", ASCENDING)], name="semester_page"),
+        IndexModel([("updated_at", ASCENDING)], name="updated_at"),
+    ],
+    "student_gpa": [
+        IndexModel([("student_id", ASCENDING)], name="student_id_unique", unique=True),
+        IndexModel([("department", ASCENDING)], name="department"),
+        # Dashboard conditional GETs look the data version up by roll number
+        IndexModel([("roll_number", ASCENDING)], name="roll_number_unique", unique=True,
+                   partialFilterExpression={"roll_number": {"$gt": ""}}),
+    ],
+    "grading_schemes": [
+        IndexModel([("department", ASCENDING)], name="department_unique", unique=True),
+    ],
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Claiming a job: queued and due, or running with an expired lease
+        IndexModel([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at"),
+        IndexModel([("status", ASCENDING), ("lease_until", ASCENDING)], name="status_lease_until"),
+        # Finished jobs are kept a week for polling and inspection
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+}
+
+# One representative filter and sort per route query shape, checked by
+# `explain_query_shapes`. Id values are placeholders; only the shape matters.
+ID = "00000000-0000-0000-0000-000000000000"
+OTHER_ID = "00000000-0000-0000-0000-000000000001"
+BY_ID = [("_id", ASCENDING)]
+QUERY_SHAPES: List[Tuple[str, str, dict, Optional[list]]] = [
+    ("register / login (teacher)", "users", {"email": "teacher@example.edu"}, None),
+    ("register / login (student)", "users", {"student_id": "STU0001"}, None),
+    ("auth/me", "users", {"id": ID}, None),
+    ("students", "users", {"role": "student", "department": "AI/ML"}, BY_ID),
+    ("students (semester)", "users", {"role": "student", "department": "AI/ML", "semester": 3}, BY_ID),
+    ("students/search", "users", {"role": "student", "search_tokens": {"$all": ["ali", "joh"]}}, None),
+    ("students/search (student id)", "users",
+     {"role": "student", "$or": [{"student_id": "STU0001"}, {"student_id": "stu0001"}]}, None),
+    ("students/search (fuzzy)", "users", {"role": "student", "search_tokens": {"$in": ["~ali", "~lic"]}}, None),
+    ("create_subject", "subjects", {"code": "ML101", "semester": 3}, None),
+    ("subjects (department)", "subjects", {"department": "AI/ML"}, BY_ID),
+    ("subjects (semester)", "subjects", {"semester": 3}, BY_ID),
+    ("subjects (department, semester)", "subjects", {"department": "AI/ML", "semester": 3}, BY_ID),
+    ("gpa rebuild (subjects)", "subjects", {"department": {"$in": ["AI/ML", "CSE"]}}, BY_ID),
+    ("delete_subject", "subjects", {"id": ID}, None),
+    ("marks upsert", "marks", {"student_id": ID, "subject_id": ID}, None),
+    ("marks/student", "marks", {"student_id": ID}, BY_ID),
+    ("marks/subject", "marks", {"subject_id": ID}, BY_ID),
+    ("analytics", "marks", {"subject_id": {"$in": [ID]}, "final_exam": {"$ne": None}}, None),
+    ("dashboard/batch (marks)", "marks", {"student_id": {"$in": [ID]}}, None),
+    ("export/marks (semester)", "marks", {"semester": 3}, BY_ID),
+    ("export/marks (department)", "marks", {"subject_id": {"$in": [ID, OTHER_ID]}, "semester": 3}, BY_ID),
+    ("export/cohort (marks)", "marks", {"student_id": {"$in": [ID, OTHER_ID]}},
+     [("student_id", ASCENDING), ("subject_id", ASCENDING)]),
+    ("export/transcripts", "users", {"role": "student", "department": "AI/ML"}, BY_ID),
+    ("dashboard", "student_gpa", {"student_id": ID}, None),
+    ("delete_subject (gpa)", "student_gpa", {"department": "AI/ML"}, None),
+    ("dashboard (If-None-Match)", "student_gpa", {"roll_number": "STU0001"}, None),
+    ("grading scheme", "grading_schemes", {"department": "AI/ML"}, None),
+    ("delete_subject job (marks)", "marks", {"subject_id": ID}, None),
+    ("jobs", "jobs", {"id": ID}, None),
+    ("jobs claim", "jobs", {"$or": [{"status": "queued", "run_at": {"$lte": 0}},
+                                    {"status": "running", "lease_until": {"$lt": 0}}]},
+     [("run_at", ASCENDING)]),
+    ("jobs lease expiry", "jobs", {"status": "running", "lease_until": {"$lt": 0}}, None),
+]
+
+
+def _index_spec(info: dict) -> dict:
+    """Normalize index information so declared and existing indexes compare equal"""
+    spec = {"key": list(info["key"].items())}
+    for option in ("unique", "partialFilterExpression", "sparse", "expireAfterSeconds"):
+        if info.get(option):
+            spec[option] = info[option]
+    return spec
+
+
+async def ensure_indexes(db, drop_stale: bool = True) -> None:
+    """Create missing indexes and rebuild any whose definition has drifted"""
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = {info["name"]: info async for info in collection.list_indexes()}
+
+        for model in models:
+            declared = model.document
+            name = declared["name"]
+            current = existing.get(name)
+
+            if current is not None:
+                if _index_spec(current) == _index_spec(declared):
+                    continue
+                if not drop_stale:
+                    logger.warning("Index %s.%s differs from its declaration", collection_name, name)
+                    continue
+                logger.info("Rebuilding index %s.%s", collection_name, name)
+                await _drop_index(collection, name)
+
+            try:
+                await collection.create_indexes([model])
+                logger.info("Created index %s.%s", collection_name, name)
+            except OperationFailure as e:
+                # Usually duplicate data left behind by the old check-then-insert
+                # writes; keep serving and let an operator clean it up.
+                logger.error("Could not create index %s.%s: %s", collection_name, name, e)
+
+
+async def _drop_index(collection, name: str) -> None:
+    try:
+        await collection.drop_index(name)
+    except OperationFailure as e:
+        # Another worker starting at the same time dropped it first
+        if e.code != INDEX_NOT_FOUND:
+            raise
+
+
+def _plan_stages(plan: dict):
+    yield plan.get("stage")
+    for child in ("inputStage", "queryPlan"):
+        if child in plan:
+            yield from _plan_stages(plan[child])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+async def explain_query_shapes(db) -> List[dict]:
+    """Explain every route query shape with its sort and report the winning plan stages"""
+    results = []
+    for route, collection_name, query, sort in QUERY_SHAPES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explanation = await cursor.explain()
+        winning_plan = explanation["queryPlanner"]["winningPlan"]
+        stages = [stage for stage in _plan_stages(winning_plan) if stage]
+        results.append({
+            "route": route,
+            "collection": collection_name,
+            "query": query,
+            "sort": sort,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+            # An in-memory sort; SORT_MERGE of index-ordered inputs is fine
+            "blocking_sort": "SORT" in stages,
+        })
+    return results
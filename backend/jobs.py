@@ -0,0 +1,176 @@
+"""Background jobs persisted in MongoDB and run by in-process workers.
+
+Handlers are registered by type. `enqueue` stores a job document and returns
+at once; every API worker runs `concurrency` runner tasks that claim queued
+jobs with an atomic find_one_and_update, so a job runs exactly once even with
+several uvicorn workers. Job documents look like
+
+    {
+        "id": <uuid>, "type": "delete_subject", "params": {...},
+        "status": "queued" | "running" | "succeeded" | "failed",
+        "attempts": 1, "max_attempts": 3, "run_at": <date>, "lease_until": <date>,
+        "progress": {"done": 1200, "total": 5000}, "result": {...}, "error": "...",
+        "created_at": <date>, "started_at": <date>, "finished_at": <date>,
+    }
+
+A running job holds a lease that progress updates extend; if its worker dies,
+another worker reclaims it once the lease expires. Failures are retried with
+exponential backoff until `max_attempts`, so handlers must be idempotent.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+JOBS = REGISTRY.counter("jobs_total", "Background job attempts by type and outcome", ("type", "outcome"))
+
+Handler = Callable[[object, dict, "JobContext"], Awaitable[Optional[dict]]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """Passed to handlers to report progress (which also renews the job's lease)"""
+
+    def __init__(self, queue: "JobQueue", job: dict):
+        self.queue = queue
+        self.job = job
+
+    async def progress(self, done: int, total: Optional[int] = None) -> None:
+        await self.queue.db.jobs.update_one(
+            {"id": self.job["id"], "status": "running"},
+            {"$set": {"progress": {"done": done, "total": total}, "lease_until": _now() + self.queue.lease}}
+        )
+
+
+class JobQueue:
+    def __init__(self, db, concurrency: int = 2, poll_interval: float = 2.0, lease: float = 300.0,
+                 retry_base: float = 5.0, handlers: Optional[Dict[str, Handler]] = None):
+        self.db = db
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = timedelta(seconds=lease)
+        self.retry_base = retry_base
+        self.handlers: Dict[str, Handler] = dict(handlers or {})
+        self._runners: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def handler(self, job_type: str):
+        def register(fn: Handler) -> Handler:
+            self.handlers[job_type] = fn
+            return fn
+        return register
+
+    async def enqueue(self, job_type: str, params: dict, max_attempts: int = 3) -> dict:
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type {job_type}")
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "params": params,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "created_at": now,
+        }
+        await self.db.jobs.insert_one(job)
+        job.pop("_id", None)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.db.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def claim(self) -> Optional[dict]:
+        """Atomically take the oldest due job, or one whose worker let its lease expire"""
+        now = _now()
+        # A job that keeps killing its worker must not be reclaimed forever
+        await self.db.jobs.update_many(
+            {"status": "running", "lease_until": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+            {"$set": {"status": "failed", "error": "Lease expired on the final attempt", "finished_at": now}}
+        )
+        return await self.db.jobs.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now},
+                 "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+            ]},
+            {"$set": {"status": "running", "started_at": now, "lease_until": now + self.lease},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def run(self, job: dict) -> None:
+        handler = self.handlers.get(job["type"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job type {job['type']}")
+            result = await handler(self.db, job["params"], JobContext(self, job))
+        except asyncio.CancelledError:
+            # Shutting down: leave the job running so its lease expires and another worker retries it
+            raise
+        except Exception as e:
+            logger.exception("Job %s (%s) failed on attempt %s", job["id"], job["type"], job["attempts"])
+            retry = job["attempts"] < job["max_attempts"]
+            if retry:
+                backoff = timedelta(seconds=self.retry_base * 2 ** (job["attempts"] - 1))
+                update = {"status": "queued", "run_at": _now() + backoff}
+            else:
+                update = {"status": "failed", "finished_at": _now()}
+            await self.db.jobs.update_one({"id": job["id"]}, {"$set": {**update, "error": str(e)}})
+            JOBS.inc(job["type"], "retry" if retry else "failed")
+            return
+
+        await self.db.jobs.update_one(
+            {"id": job["id"]},
+            {"$set": {"status": "succeeded", "result": result, "error": None, "finished_at": _now()}}
+        )
+        JOBS.inc(job["type"], "succeeded")
+
+    async def _runner(self) -> None:
+        while True:
+            # Cleared before claiming, so a job enqueued meanwhile still wakes us
+            self._wakeup.clear()
+            try:
+                job = await self.claim()
+            except Exception:
+                logger.exception("Could not claim a job")
+                job = None
+            if job is not None:
+                try:
+                    await self.run(job)
+                except Exception:
+                    # Its lease runs out and the job is retried (or failed) by a later claim
+                    logger.exception("Could not record the outcome of job %s", job["id"])
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._runners = [asyncio.create_task(self._runner()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._runners:
+            task.cancel()
+        await asyncio.gather(*self._runners, return_exceptions=True)
+        self._runners = []
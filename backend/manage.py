@@ -0,0 +1,208 @@
+"""Operational commands: python manage.py --help"""
+import asyncio
+import os
+from pathlib import Path
+
+import typer
+from dotenv import load_dotenv
+from starlette.datastructures import UploadFile
+
+from auth import PASSWORD_MAX_BYTES, PASSWORD_MIN_LENGTH, password_fits_bcrypt, pwd_context
+from database import create_client
+from gpa import rebuild_student_gpa, verify_student_gpa
+from indexes import ensure_indexes, explain_query_shapes
+from migrations import TIMESTAMP_FIELDS, migrate_timestamp_field
+from parity import check_fixture_parity, compare_engines
+from roster import import_roster
+from search import backfill_search_tokens
+from uploads import UploadFormatError, iter_upload_chunks
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+cli = typer.Typer(help="Maintenance commands for the marks dashboard backend")
+
+
+def run_with_db(coro_fn, *args, **kwargs):
+    """Open a client, run an async command against the configured database, close it"""
+    async def runner():
+        client = create_client()
+        try:
+            return await coro_fn(client[os.environ['DB_NAME']], *args, **kwargs)
+        finally:
+            client.close()
+    return asyncio.run(runner())
+
+
+@cli.command("ensure-indexes")
+def ensure_indexes_command(
+    keep_stale: bool = typer.Option(False, help="Warn about drifted indexes instead of rebuilding them"),
+):
+    """Create and reconcile all declared indexes"""
+    run_with_db(ensure_indexes, drop_stale=not keep_stale)
+    typer.echo("Indexes are up to date")
+
+
+@cli.command("check-indexes")
+def check_indexes_command():
+    """Explain every route query shape and fail if any of them scans a whole collection or sorts in memory"""
+    async def check(db):
+        await ensure_indexes(db, drop_stale=False)
+        return await explain_query_shapes(db)
+
+    results = run_with_db(check)
+    failures = 0
+    for result in results:
+        marker = "COLLSCAN" if result["collscan"] else "SORT" if result["blocking_sort"] else "ok"
+        typer.echo(f"[{marker:>8}] {result['route']}: {result['collection']} {' > '.join(result['stages'])}")
+        failures += result["collscan"] or result["blocking_sort"]
+
+    if failures:
+        typer.echo(f"{failures} query shape(s) fall back to a collection scan or an in-memory sort", err=True)
+        raise typer.Exit(code=1)
+
+
+async def _batches(cursor, batch_size: int):
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _recompute_gpa(db, department, batch_size: int, verify: bool):
+    query = {"role": "student"}
+    if department:
+        query["department"] = department
+    rebuilt, mismatched = 0, []
+    async for students in _batches(db.users.find(query, {"_id": 0}), batch_size):
+        await rebuild_student_gpa(db, students)
+        rebuilt += len(students)
+        if verify:
+            mismatched += await verify_student_gpa(db, students)
+    return rebuilt, mismatched
+
+
+@cli.command("recompute-gpa")
+def recompute_gpa_command(
+    department: str = typer.Option(None, help="Only rebuild students of this department"),
+    batch_size: int = typer.Option(500, min=1, help="Students rebuilt per round trip"),
+    verify: bool = typer.Option(True, help="Check the stored result against a from-scratch computation"),
+):
+    """Rebuild the materialized student_gpa collection from marks and subjects"""
+    rebuilt, mismatched = run_with_db(_recompute_gpa, department, batch_size, verify)
+    typer.echo(f"Rebuilt GPA for {rebuilt} student(s)")
+    if mismatched:
+        typer.echo(f"{len(mismatched)} student(s) differ from the from-scratch computation: "
+                   f"{', '.join(mismatched[:20])}", err=True)
+        raise typer.Exit(code=1)
+
+
+@cli.command("migrate-timestamps")
+def migrate_timestamps_command(
+    batch_size: int = typer.Option(1000, min=1, help="Documents converted per round trip"),
+):
+    """Convert ISO-string timestamps to native BSON dates (online and resumable)"""
+    async def migrate(db):
+        for collection_name, field in TIMESTAMP_FIELDS:
+            converted = await migrate_timestamp_field(db, collection_name, field, batch_size)
+            typer.echo(f"{collection_name}.{field}: converted {converted} document(s)")
+        # student_gpa embeds copies of subjects and marks; rebuild them from the converted sources
+        rebuilt, _ = await _recompute_gpa(db, None, 500, verify=False)
+        typer.echo(f"Rebuilt GPA for {rebuilt} student(s)")
+
+    run_with_db(migrate)
+
+
+@cli.command("import-roster")
+def import_roster_command(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="CSV or XLSX roster"),
+    department: str = typer.Option(None, help="Department for rows without one"),
+    chunk_size: int = typer.Option(1000, min=1, help="Rows inserted per round trip"),
+):
+    """Register the students of a roster file (same report as POST /api/students/import)"""
+    async def run(db):
+        with path.open("rb") as file:
+            upload = UploadFile(file=file, filename=path.name)
+            return await import_roster(db, iter_upload_chunks(upload, chunk_size), department)
+
+    try:
+        report = run_with_db(run)
+    except UploadFormatError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(code=1)
+
+    for duplicate in report["duplicates"]:
+        typer.echo(f"row {duplicate['row']}: duplicate {duplicate['field']} {duplicate['value']}")
+    for error in report["errors"]:
+        typer.echo(f"row {error['row']}: {'; '.join(error['errors'])}")
+    typer.echo(f"Imported {report['accepted']} of {report['received']} row(s): "
+               f"{report['duplicate']} duplicate, {report['invalid']} invalid")
+    if report.get("aborted"):
+        raise typer.Exit(code=1)
+
+
+@cli.command("build-search-tokens")
+def build_search_tokens_command(
+    batch_size: int = typer.Option(1000, min=1, help="Students updated per round trip"),
+):
+    """Compute the typeahead search tokens of every student (new registrations get them automatically)"""
+    updated = run_with_db(backfill_search_tokens, batch_size)
+    typer.echo(f"Updated search tokens for {updated} student(s)")
+
+
+@cli.command("check-dashboard-parity")
+def check_dashboard_parity_command(
+    live: bool = typer.Option(False, help="Compare engines over the real students instead of the fixtures"),
+    batch_size: int = typer.Option(200, min=1, help="Students compared per batch with --live"),
+):
+    """Check that the Python, materialized and aggregation dashboard engines agree byte for byte"""
+    async def check(db):
+        if live:
+            mismatches = []
+            async for students in _batches(db.users.find({"role": "student"}, {"_id": 0}), batch_size):
+                mismatches += await compare_engines(db, students)
+            return mismatches
+        # Fixtures go into a throwaway database next to the configured one
+        scratch = db.client[f"{db.name}_parity"]
+        await scratch.client.drop_database(scratch.name)
+        try:
+            return await check_fixture_parity(scratch)
+        finally:
+            await scratch.client.drop_database(scratch.name)
+
+    mismatches = run_with_db(check)
+    for mismatch in mismatches:
+        typer.echo(f"MISMATCH {mismatch['engine']}: {mismatch['student_id']}", err=True)
+    if mismatches:
+        raise typer.Exit(code=1)
+    typer.echo("All dashboard engines agree")
+
+
+@cli.command("set-password")
+def set_password_command(
+    identifier: str = typer.Argument(..., help="Teacher email or student ID"),
+    password: str = typer.Option(..., prompt=True, hide_input=True, confirmation_prompt=True),
+):
+    """Set a user's password (accounts created before hashed passwords cannot sign in until this is run)"""
+    if len(password) < PASSWORD_MIN_LENGTH or not password_fits_bcrypt(password):
+        typer.echo(f"Password must be at least {PASSWORD_MIN_LENGTH} characters and at most "
+                   f"{PASSWORD_MAX_BYTES} bytes in UTF-8", err=True)
+        raise typer.Exit(code=1)
+
+    async def update(db):
+        field = "email" if "@" in identifier else "student_id"
+        result = await db.users.update_one({field: identifier}, {"$set": {"password_hash": pwd_context.hash(password)}})
+        return result.matched_count
+
+    if not run_with_db(update):
+        typer.echo(f"No user {identifier}", err=True)
+        raise typer.Exit(code=1)
+    typer.echo(f"Password updated for {identifier}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,282 @@
+"""In-process Prometheus metrics: request latency, MongoDB command timing and pool waits.
+
+Everything is kept in this process and rendered in the Prometheus text
+format by `GET /metrics`; no client library or push gateway is involved.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # labels -> ([per-bucket counts], sum, count)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = _format_labels(self.label_names, labels, f'le="{_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """A counter or gauge whose samples are read from application state at scrape time"""
+
+    def __init__(self, name: str, help: str, type: str, collect: Callable[[], Iterable[Tuple[Sequence[str], float]]],
+                 labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.type = type
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = REQUEST_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name: str, help: str, type: str, collect, labels: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, type, collect, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template", ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "http_requests_in_flight", "HTTP requests currently being served")
+MONGO_COMMAND_DURATION = REGISTRY.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round-trip time", ("collection", "command"), MONGO_BUCKETS)
+MONGO_COMMANDS = REGISTRY.counter(
+    "mongo_commands_total", "MongoDB commands by outcome", ("collection", "command", "outcome"))
+MONGO_POOL_CHECKOUT_WAIT = REGISTRY.histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool",
+    ("outcome",), MONGO_BUCKETS)
+MONGO_POOL_CONNECTIONS = REGISTRY.gauge(
+    "mongo_pool_connections", "Open pooled connections by state", ("state",))
+
+
+def command_collection(command_name: str, command: dict) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    target = command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Times every MongoDB command per collection and command name"""
+
+    def __init__(self):
+        # request_id -> (collection, command); listener callbacks run on Motor's executor threads
+        self._pending: Dict[int, Tuple[str, str]] = {}
+
+    def started(self, event):
+        self._pending[event.request_id] = (command_collection(event.command_name, event.command), event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+    def _finish(self, event, outcome: str) -> None:
+        collection, command = self._pending.pop(event.request_id, ("", event.command_name))
+        MONGO_COMMAND_DURATION.observe(event.duration_micros / 1e6, collection, command)
+        MONGO_COMMANDS.inc(collection, command, outcome)
+
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Measures checkout waits and tracks pooled connections"""
+
+    def __init__(self):
+        # Checkout start and end are reported on the same thread
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _waited(self, outcome: str) -> None:
+        started: Optional[float] = getattr(self._local, "started", None)
+        if started is not None:
+            MONGO_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started, outcome)
+            self._local.started = None
+
+    def connection_checked_out(self, event):
+        self._waited("success")
+        MONGO_POOL_CONNECTIONS.inc("in_use")
+
+    def connection_check_out_failed(self, event):
+        self._waited(str(event.reason))
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CONNECTIONS.dec("in_use")
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc("open")
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec("open")
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+MONGO_LISTENERS = [CommandMetricsListener(), PoolMetricsListener()]
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per route template and status, plus in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope; label by its template, not the raw path
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, scope["method"], route, str(status_code))
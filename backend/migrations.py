@@ -0,0 +1,76 @@
+"""Online, resumable data migrations run through `manage.py`"""
+import logging
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# (collection, field) pairs that used to be written as ISO-8601 strings
+TIMESTAMP_FIELDS = [
+    ("users", "created_at"),
+    ("subjects", "created_at"),
+    ("marks", "updated_at"),
+]
+
+
+def parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        # Everything was written from datetime.now(timezone.utc)
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+async def migrate_timestamp_field(db, collection_name: str, field: str, batch_size: int = 1000) -> int:
+    """Convert string timestamps in `collection_name.field` to BSON dates; returns documents converted.
+
+    Progress is checkpointed by `_id` in the `migrations` collection, so an
+    interrupted run picks up where it stopped. Each update only applies while
+    the field still holds the string that was read, so concurrent writes of
+    fresh dates are never overwritten.
+    """
+    migration_id = f"timestamps:{collection_name}.{field}"
+    state = await db.migrations.find_one({"_id": migration_id}) or {}
+
+    collection = db[collection_name]
+    converted = 0
+    last_id = state.get("last_id")
+    while True:
+        query = {field: {"$type": "string"}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await collection.find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        batch_converted = 0
+        operations = []
+        for doc in batch:
+            try:
+                value = parse_timestamp(doc[field])
+            except ValueError:
+                logger.warning("Skipping unparseable %s.%s on %s: %r", collection_name, field, doc["_id"], doc[field])
+                continue
+            operations.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+        if operations:
+            result = await collection.bulk_write(operations, ordered=False)
+            batch_converted = result.modified_count
+            converted += batch_converted
+
+        last_id = batch[-1]["_id"]
+        await db.migrations.update_one(
+            {"_id": migration_id},
+            {"$set": {"last_id": last_id}, "$inc": {"converted": batch_converted}},
+            upsert=True
+        )
+        logger.info("%s: converted %d so far", migration_id, converted)
+
+    # A finished pass clears the checkpoint, so a rerun sweeps up strings
+    # written by workers that were still on the old code
+    await db.migrations.update_one(
+        {"_id": migration_id},
+        {"$set": {"finished_at": datetime.now(timezone.utc)}, "$unset": {"last_id": ""}},
+        upsert=True
+    )
+    return converted
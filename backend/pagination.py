@@ -0,0 +1,46 @@
+"""Keyset (cursor) pagination over `_id`.
+
+Pages are ordered by `_id`, i.e. insertion order, which is what the list
+endpoints returned before they were paginated. The cursor is the last `_id`
+of the page, base64-encoded so clients treat it as opaque.
+"""
+import base64
+import binascii
+from typing import Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursor(ValueError):
+    """The `after` token was not issued by `paginate`"""
+
+
+def encode_cursor(object_id: ObjectId) -> str:
+    return base64.urlsafe_b64encode(object_id.binary).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> ObjectId:
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise InvalidCursor("Invalid pagination cursor")
+
+
+async def paginate(collection, query: dict, limit: int, after: Optional[str] = None, projection: Optional[dict] = None) -> dict:
+    """Fetch one page of `query` and return it as {"items": [...], "next_cursor": ...}"""
+    if after:
+        query = {**query, "_id": {"$gt": decode_cursor(after)}}
+
+    # One extra document tells us whether another page exists
+    cursor = collection.find(query, projection).sort("_id", 1).limit(limit + 1)
+    docs = await cursor.to_list(limit + 1)
+
+    next_cursor = encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    items = docs[:limit]
+    for doc in items:
+        doc.pop("_id", None)
+    return {"items": items, "next_cursor": next_cursor}
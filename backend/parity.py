@@ -0,0 +1,154 @@
+"""Parity checks between the dashboard engines.
+
+`python manage.py check-dashboard-parity` seeds a scratch database with the
+edge cases below and asserts that the Python join, the materialized
+student_gpa documents and the aggregation pipeline all render byte-identical
+dashboards. With --live it compares the engines over the real students.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from aggregation import aggregate_semester_data
+from gpa import (
+    build_semester_data, canonical_dashboard, load_gpa_inputs, rebuild_student_gpa, semester_data_from_gpa,
+)
+from grading import GRADE_BANDS, GradingScheme
+
+# Every band boundary, just below it, integer and missing finals
+FIXTURE_FINALS = [0, 39.99, 40, 49.99, 50, 59.5, 60, 69.99, 70, 79.99, 80, 85, 89.99, 90, 100.0, None]
+
+# Departments graded by a non-default scheme, one student each with a subject per row below
+FIXTURE_SCHEMES = {
+    "PAR/WEIGHTED": GradingScheme({"internal1": 0.1, "internal2": 0.1, "internal3": 0.1, "final_exam": 0.7},
+                                  GRADE_BANDS),
+    "PAR/PASS": GradingScheme({"internal1": 0.25, "final_exam": 0.75}, GRADE_BANDS,
+                              pass_final_exam=35, pass_score=45),
+}
+# (internal1, internal2, internal3, final_exam); the comments give the weighted totals under
+# PAR/WEIGHTED and PAR/PASS, chosen to land on a band or pass boundary or just below it
+FIXTURE_COMPONENTS = [
+    (90, 90, 90, 90),                            # 90.0, 90.0
+    (89.99999, 89.99999, 89.99999, 89.99999),    # 89.99999, 89.99999
+    (100, 100, 100, 85.71428571428571),          # 90.0 only after float rounding, 89.2857...
+    (90, 90, 90, 89.99999),                      # 89.999993, 89.9999925
+    (90.00004, None, None, 89.99999),            # 71.999997, 90.0000025
+    (100, None, 40, 35),                         # 38.5, 51.25
+    (100, None, 40, 34.99999),                   # 38.499993, final exam below its pass mark
+    (0, None, None, 60),                         # 42.0, 45.0 exactly the pass score
+    (0, None, None, 59.99999),                   # 41.999993, just below the pass score
+    (None, None, None, None),                    # no final exam: not graded
+]
+
+
+def _subject(department: str, semester: int, credits: int, code: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Subject {code}",
+        "code": code,
+        "semester": semester,
+        "credits": credits,
+        "department": department,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def _marks(student: dict, subject: dict, final_exam, semester=None, internals=(30.0, None, 35.5)) -> dict:
+    internal1, internal2, internal3 = internals
+    return {
+        "student_id": student["id"],
+        "subject_id": subject["id"],
+        "semester": subject["semester"] if semester is None else semester,
+        "internal1": internal1,
+        "internal2": internal2,
+        "internal3": internal3,
+        "final_exam": final_exam,
+        "id": str(uuid.uuid4()),
+        "updated_at": datetime.now(timezone.utc),
+    }
+
+
+def _student(department: str, roll: str) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "name": f"Student {roll}",
+        "email": None,
+        "student_id": roll,
+        "role": "student",
+        "department": department,
+        "semester": 3,
+        "created_at": datetime.now(timezone.utc),
+    }
+
+
+def fixture_documents():
+    """Users, subjects and marks covering the grading and join edge cases"""
+    subjects = [
+        _subject("AI/ML", 1 + index % 8, 1 + index % 5, f"AI{index:03d}")
+        for index in range(len(FIXTURE_FINALS))
+    ]
+    semester_nine = _subject("AI/ML", 9, 3, "AI900")
+    other_department = _subject("CSE", 3, 4, "CS300")
+    subjects += [semester_nine, other_department]
+
+    students = [_student("AI/ML", f"PAR{index:03d}") for index in range(4)]
+    full, rotated, sparse, _ = students
+    marks = []
+    for index, final_exam in enumerate(FIXTURE_FINALS):
+        marks.append(_marks(full, subjects[index], final_exam))
+        marks.append(_marks(rotated, subjects[index], FIXTURE_FINALS[(index + 5) % len(FIXTURE_FINALS)]))
+    # Marks that must not count: wrong semester, semester outside 1-8, other department
+    marks.append(_marks(sparse, subjects[0], 95.0, semester=subjects[0]["semester"] + 1))
+    marks.append(_marks(sparse, semester_nine, 95.0))
+    marks.append(_marks(sparse, other_department, 95.0))
+    marks.append(_marks(sparse, subjects[1], 72.0))
+    students.append(_student("CSE", "PAR900"))
+
+    for number, department in enumerate(FIXTURE_SCHEMES, start=1):
+        student = _student(department, f"PAR{number}00")
+        students.append(student)
+        for index, (*internals, final_exam) in enumerate(FIXTURE_COMPONENTS):
+            subject = _subject(department, 1 + index % 8, 1 + index % 5, f"SC{number}{index:02d}")
+            subjects.append(subject)
+            marks.append(_marks(student, subject, final_exam, internals=internals))
+    return students, subjects, marks
+
+
+async def compare_engines(db, students: List[dict], materialized: bool = True) -> List[dict]:
+    """Render each student's dashboard with every engine; returns one record per mismatch"""
+    marks_by_student, subjects_by_department, schemes = await load_gpa_inputs(db, students)
+    stored = {}
+    if materialized:
+        stored = {
+            doc["student_id"]: doc
+            async for doc in db.student_gpa.find({"student_id": {"$in": [s["id"] for s in students]}})
+        }
+
+    mismatches = []
+    for student in students:
+        scheme = schemes[student["department"]]
+        expected = canonical_dashboard(*build_semester_data(
+            marks_by_student[student["id"]], subjects_by_department[student["department"]], scheme
+        ))
+        rendered = {"aggregation": canonical_dashboard(*await aggregate_semester_data(db, student, scheme))}
+        if materialized:
+            doc = stored.get(student["id"])
+            rendered["materialized"] = canonical_dashboard(*semester_data_from_gpa(doc)) if doc else b"<missing>"
+        for engine, output in rendered.items():
+            if output != expected:
+                mismatches.append({"student_id": student["student_id"], "engine": engine})
+    return mismatches
+
+
+async def check_fixture_parity(db) -> List[dict]:
+    """Seed the edge-case fixtures into `db`, compare all engines and return the mismatches"""
+    users, subjects, marks = fixture_documents()
+    await db.grading_schemes.insert_many([
+        {**scheme.to_doc(), "department": department} for department, scheme in FIXTURE_SCHEMES.items()
+    ])
+    await db.users.insert_many(users)
+    await db.subjects.insert_many(subjects)
+    await db.marks.insert_many(marks)
+    students = await db.users.find({"role": "student"}, {"_id": 0}).to_list(None)
+    await rebuild_student_gpa(db, students)
+    return await compare_engines(db, students)
@@ -0,0 +1,115 @@
+"""Bulk student roster import.
+
+Rows are validated per chunk and inserted with one unordered `insert_many`
+per chunk; the unique indexes on `student_id` and `email` reject duplicates
+(against existing users and within the file), and their write errors are
+mapped back to row numbers for the report.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from pymongo.errors import BulkWriteError
+
+from auth import Password, hasher
+from gpa import empty_gpa_doc
+from search import search_tokens
+from uploads import MalformedRow, Row, UploadFormatError, record_abort, validation_messages
+
+DUPLICATE_KEY = 11000
+
+
+class RosterRow(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    name: str = Field(min_length=1)
+    student_id: str = Field(min_length=1)
+    department: str = Field(min_length=1)
+    semester: int = Field(ge=1, le=8)
+    email: Optional[str] = None
+    # Without a password the account cannot sign in until `manage.py set-password`
+    password: Optional[Password] = None
+
+
+def new_report() -> dict:
+    return {"received": 0, "accepted": 0, "duplicates": [], "errors": []}
+
+
+def finish_report(report: dict) -> dict:
+    report["duplicate"] = len(report["duplicates"])
+    report["invalid"] = len(report["errors"])
+    return report
+
+
+async def import_roster_chunk(db, chunk: List[Row], report: dict, department: Optional[str] = None) -> None:
+    """Validate one chunk of roster rows and insert the valid students in a single unordered insert_many"""
+    report["received"] += len(chunk)
+    rows = []
+    for row_number, row in chunk:
+        if isinstance(row, MalformedRow):
+            report["errors"].append({"row": row_number, "errors": [row.message]})
+            continue
+        # JSON bodies can hold anything; non-object rows fail validation below like any other bad row
+        if department and isinstance(row, dict) and not row.get("department"):
+            row = {**row, "department": department}
+        try:
+            rows.append((row_number, RosterRow.model_validate(row)))
+        except ValidationError as e:
+            report["errors"].append({"row": row_number, "errors": validation_messages(e)})
+    if not rows:
+        return
+
+    # bcrypt dominates an import that carries passwords; rows without one cost nothing here
+    with_password = [student for _, student in rows if student.password]
+    hashes = iter(await hasher.hash_batch([student.password for student in with_password]))
+
+    now = datetime.now(timezone.utc)
+    docs = []
+    for _, student in rows:
+        doc = {
+            "id": str(uuid.uuid4()),
+            "name": student.name,
+            "email": student.email,
+            "student_id": student.student_id,
+            "role": "student",
+            "department": student.department,
+            "semester": student.semester,
+            "created_at": now,
+        }
+        if student.password:
+            doc["password_hash"] = next(hashes)
+        doc["search_tokens"] = search_tokens(doc)
+        docs.append(doc)
+
+    rejected = set()
+    try:
+        await db.users.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            index = error["index"]
+            rejected.add(index)
+            row_number = rows[index][0]
+            if error.get("code") == DUPLICATE_KEY:
+                default = "email" if "email_unique" in error.get("errmsg", "") else "student_id"
+                field = next(iter(error.get("keyPattern") or {}), default)
+                report["duplicates"].append({"row": row_number, "field": field, "value": docs[index].get(field)})
+            else:
+                report["errors"].append({"row": row_number, "errors": [error.get("errmsg", "insert failed")]})
+
+    inserted = [doc for index, doc in enumerate(docs) if index not in rejected]
+    report["accepted"] += len(inserted)
+    if inserted:
+        await db.student_gpa.insert_many([empty_gpa_doc(doc) for doc in inserted], ordered=False)
+
+
+async def import_roster(db, chunks: AsyncIterator[List[Row]], department: Optional[str] = None) -> dict:
+    """Import every chunk; an unreadable file raises UploadFormatError unless rows were already imported"""
+    report = new_report()
+    try:
+        async for chunk in chunks:
+            await import_roster_chunk(db, chunk, report, department)
+    except UploadFormatError as e:
+        if not report["received"]:
+            raise
+        record_abort(report, e)
+    return finish_report(report)
@@ -0,0 +1,161 @@
+"""Per-request MongoDB round-trip accounting.
+
+`RoundTripMiddleware` opens a `RequestStats` for every HTTP request in a
+context variable. Motor copies the caller's context onto its executor
+threads, so `RoundTripListener` can charge each command (including getMore)
+to the request that issued it: commands, documents returned, reply bytes and
+time spent in MongoDB. Totals go out in a `Server-Timing` header
+
+    Server-Timing: mongo;dur=4.21;desc="3 commands, 12 docs, 5.1 KiB"
+
+and to the debug log. Sizing a reply means re-encoding it, so bytes are only
+counted with `RoundTripListener(measure_bytes=True)` (debugging, tests) and
+left out of both otherwise. Routes can be given a maximum number of round trips;
+with `enforce=True` (test mode) a request over its budget is answered with a
+500 naming the route and its count, so the test suite fails on the change
+that added the query. Work that outlives the response headers (streaming
+bodies) is in the log line but not in the header.
+"""
+import logging
+import threading
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+import bson
+import orjson
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+Budgets = Dict[Tuple[str, str], int]
+
+
+class RequestStats:
+    __slots__ = ("commands", "documents", "bytes", "seconds", "_lock")
+
+    def __init__(self):
+        self.commands = 0
+        self.documents = 0
+        # Stays None unless the listener measures reply sizes
+        self.bytes: Optional[int] = None
+        self.seconds = 0.0
+        # Concurrent commands of one request (asyncio.gather) finish on different threads
+        self._lock = threading.Lock()
+
+    def record(self, documents: int, seconds: float, size: Optional[int] = None) -> None:
+        with self._lock:
+            self.commands += 1
+            self.documents += documents
+            self.seconds += seconds
+            if size is not None:
+                self.bytes = (self.bytes or 0) + size
+
+    def summary(self) -> str:
+        text = f"{self.commands} commands, {self.documents} docs"
+        return text if self.bytes is None else f"{text}, {self.bytes / 1024:.1f} KiB"
+
+    def server_timing(self) -> str:
+        return f'mongo;dur={self.seconds * 1000:.2f};desc="{self.summary()}"'
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    """Stats of the request being served, or None outside a request (startup, background jobs)"""
+    return _current.get()
+
+
+def _documents(reply: dict) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or ())
+    if "value" in reply:
+        # findAndModify
+        return int(reply["value"] is not None)
+    return 0
+
+
+def _size(reply) -> int:
+    raw = getattr(reply, "raw", None)
+    return len(raw) if raw is not None else len(bson.encode(reply))
+
+
+class RoundTripListener(monitoring.CommandListener):
+    """Charges every command to the current request's `RequestStats`"""
+
+    def __init__(self, measure_bytes: bool = False):
+        self.measure_bytes = measure_bytes
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = _current.get()
+        if stats is not None:
+            size = _size(event.reply) if self.measure_bytes else None
+            stats.record(_documents(event.reply), event.duration_micros / 1e6, size)
+
+    def failed(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record(0, event.duration_micros / 1e6)
+
+
+class RoundTripMiddleware:
+    """ASGI middleware reporting each request's MongoDB usage and checking route budgets"""
+
+    def __init__(self, app, budgets: Optional[Budgets] = None, enforce: bool = False):
+        self.app = app
+        self.budgets = budgets or {}
+        self.enforce = enforce
+
+    def _over_budget(self, scope, stats: RequestStats) -> Optional[str]:
+        route = getattr(scope.get("route"), "path", None)
+        budget = self.budgets.get((scope["method"], route))
+        if budget is None or stats.commands <= budget:
+            return None
+        return f"{scope['method']} {route} made {stats.commands} MongoDB round trips (budget {budget})"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        rejected = False
+
+        async def send_with_timing(message):
+            nonlocal rejected
+            if rejected:
+                # The handler's own response was replaced by the budget error
+                return
+            if message["type"] == "http.response.start":
+                violation = self._over_budget(scope, stats)
+                if violation:
+                    logger.warning(violation)
+                    if self.enforce:
+                        rejected = True
+                        body = orjson.dumps({"detail": violation})
+                        await send({"type": "http.response.start", "status": 500, "headers": [
+                            (b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode()),
+                            (b"server-timing", stats.server_timing().encode()),
+                        ]})
+                        await send({"type": "http.response.body", "body": body})
+                        return
+                message = {**message, "headers": [
+                    *message.get("headers", []), (b"server-timing", stats.server_timing().encode())
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "%s %s: MongoDB %s, %.2f ms",
+                    scope["method"], scope["path"], stats.summary(), stats.seconds * 1000
+                )
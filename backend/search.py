@@ -0,0 +1,130 @@
+"""Typeahead student search over a maintained token array.
+
+Every student document carries `search_tokens`: the prefixes of each word of
+their name and of their student ID, plus "~"-marked trigrams of the same
+words. A multikey index on (role, search_tokens) then answers
+
+    prefix   every query term is a prefix of some word   ($all on prefixes)
+    fuzzy    enough trigrams in common (typos, transpositions)
+
+without scanning the users collection. An exact student ID lookup runs
+alongside the prefix query, so the student whose ID was typed in full is
+always in the results even when more than K names share the prefix. All
+queries share a time budget (`pymongo.timeout`, nested inside the request
+deadline); fuzzy matching is only tried when the prefix query leaves room in
+the top K.
+"""
+import asyncio
+import re
+import unicodedata
+from typing import List, Optional
+
+import pymongo
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+MAX_PREFIX = 12
+TRIGRAM_MARK = "~"
+# Share of the query's trigrams a fuzzy match must contain
+FUZZY_THRESHOLD = 0.4
+RESULT_PROJECTION = {"_id": 0, "id": 1, "name": 1, "student_id": 1, "department": 1, "semester": 1}
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_words(text: Optional[str]) -> List[str]:
+    """Lowercase, accent-free alphanumeric words"""
+    if not text:
+        return []
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _WORD.findall(ascii_text.lower())
+
+
+def trigrams(word: str) -> List[str]:
+    padded = f" {word} "
+    return [TRIGRAM_MARK + padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def search_tokens(user: dict) -> List[str]:
+    words = normalize_words(user.get("name")) + normalize_words(user.get("student_id"))
+    tokens = set()
+    for word in words:
+        tokens.update(word[:length] for length in range(1, min(len(word), MAX_PREFIX) + 1))
+        tokens.update(trigrams(word))
+    return sorted(tokens)
+
+
+def _rank(query_words: List[str], user: dict) -> tuple:
+    # Exact student ID first, then names where every term prefixes a word, then alphabetical
+    name_words = normalize_words(user.get("name"))
+    return (
+        normalize_words(user.get("student_id")) != query_words,
+        not all(any(word.startswith(term) for word in name_words) for term in query_words),
+        user.get("name") or "",
+    )
+
+
+async def search_students(db, q: str, department: Optional[str], limit: int, budget_ms: int) -> List[dict]:
+    """Top `limit` students matching `q` by prefix, topped up with fuzzy matches"""
+    query_words = normalize_words(q)
+    if not query_words:
+        return []
+    base = {"role": "student"}
+    if department:
+        base["department"] = department
+
+    # Student IDs are stored as entered; teachers often type them in lower case
+    student_ids = sorted({q.strip(), q.strip().upper()})
+    results = []
+    try:
+        with pymongo.timeout(budget_ms / 1000):
+            return await _search(db, query_words, student_ids, base, limit, results)
+    except PyMongoError as e:
+        if not e.timeout:
+            raise
+        # Out of budget: answer with whatever the prefix query produced
+        return sorted(results, key=lambda user: _rank(query_words, user))[:limit]
+
+
+async def _search(db, query_words: List[str], student_ids: List[str], base: dict, limit: int,
+                  results: List[dict]) -> List[dict]:
+    # Prefix matches are collected into `results` so a timeout can still return them
+    prefixes = [word[:MAX_PREFIX] for word in query_words]
+    exact, matches = await asyncio.gather(
+        db.users.find({**base, "$or": [{"student_id": student_id} for student_id in student_ids]},
+                      RESULT_PROJECTION).to_list(None),
+        db.users.find({**base, "search_tokens": {"$all": prefixes}}, RESULT_PROJECTION).limit(limit).to_list(limit),
+    )
+    exact_ids = {user["id"] for user in exact}
+    results.extend(exact + [user for user in matches if user["id"] not in exact_ids])
+    ranked = sorted(results, key=lambda user: _rank(query_words, user))[:limit]
+
+    query_grams = sorted({gram for word in query_words if len(word) >= 3 for gram in trigrams(word)})
+    if len(results) >= limit or not query_grams:
+        return ranked
+    seen = [user["id"] for user in results]
+    pipeline = [
+        {"$match": {**base, "search_tokens": {"$in": query_grams}, "id": {"$nin": seen}}},
+        {"$project": {**RESULT_PROJECTION,
+                      "overlap": {"$size": {"$setIntersection": ["$search_tokens", query_grams]}}}},
+        {"$match": {"overlap": {"$gte": max(1, round(len(query_grams) * FUZZY_THRESHOLD))}}},
+        {"$sort": {"overlap": -1}},
+        {"$limit": limit - len(results)},
+        {"$unset": "overlap"},
+    ]
+    return ranked + await db.users.aggregate(pipeline).to_list(None)
+
+
+async def backfill_search_tokens(db, batch_size: int = 1000) -> int:
+    """(Re)compute search_tokens for every student; returns documents updated"""
+    updated = 0
+    cursor = db.users.find({"role": "student"}, {"_id": 1, "name": 1, "student_id": 1})
+    while True:
+        users = await cursor.to_list(batch_size)
+        if not users:
+            return updated
+        await db.users.bulk_write(
+            [UpdateOne({"_id": user["_id"]}, {"$set": {"search_tokens": search_tokens(user)}}) for user in users],
+            ordered=False
+        )
+        updated += len(users)
@@ -0,0 +1,34 @@
+"""orjson fast path for large responses built from trusted database output.
+
+Handlers that return `fast_json(...)` hand FastAPI a finished Response, so
+the per-item pydantic re-validation of `response_model` and the recursive
+`jsonable_encoder` walk are both skipped. Only use it for documents that came
+straight out of MongoDB through our own write paths.
+"""
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(value: Any):
+    # ObjectId and anything else orjson does not know natively
+    return str(value)
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default, option=JSON_OPTIONS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            # Already serialized (e.g. a cached page)
+            return content
+        return dumps(content)
+
+
+def fast_json(content: Any, **kwargs) -> FastJSONResponse:
+    return FastJSONResponse(content, **kwargs)
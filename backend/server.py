@@ -1,43 +1,187 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.datastructures import UploadFile
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+import pymongo
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import os
+import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from typing import Dict, List, Optional, Tuple
 import uuid
+import hashlib
 from datetime import datetime, timezone, timedelta
 import jwt
 from jwt import exceptions as jwt_exceptions
-from passlib.context import CryptContext
+
+from aggregation import aggregate_semester_data
+from analytics import bump_marks_versions, department_statistics, marks_versions, subject_statistics
+from auth import IDENTITY_CACHE_REQUESTS, HasherBusy, Password, TokenVerifier, hasher
+from cache import MISSING, MemoryBackend, VersionedCache
+from database import create_client, warm_pool
+from deadlines import DeadlineMiddleware
+from export import MEDIA_TYPES, marks_query, stream_cohort_dashboards, stream_marks, stream_transcripts
+from gpa import (
+    apply_marks_to_gpa, bump_data_versions, data_version, empty_gpa_doc, get_data_version, rebuild_department_gpa,
+    rebuild_student_gpa, refresh_students_gpa, remove_subject_from_gpa, semester_data_from_gpa,
+)
+from grading import (
+    DEFAULT_SCHEME, FAIL_GRADE_POINT, GRADE_BANDS, GradingScheme, InvalidScheme, get_scheme,
+    get_subject_with_scheme, save_scheme, schemes_cache,
+)
+from indexes import ensure_indexes
+from jobs import Handler, JobQueue
+from metrics import MONGO_LISTENERS, MONGO_POOL_CONNECTIONS, REGISTRY, MetricsMiddleware
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, paginate
+from roster import import_roster
+from roundtrips import RoundTripListener, RoundTripMiddleware
+from search import search_students, search_tokens
+from serialization import dumps, fast_json
+from singleflight import SingleFlight
+from uploads import MalformedRow, UploadFormatError, iter_json_chunks, iter_upload_chunks, record_abort, validation_messages
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connection: each app's lifespan opens its client (see create_app) and warms the
+# pool before traffic. Pool size, wait queue and compression come from MONGO_* settings
+# (see database.py); warming defaults to minPoolSize, or 4 connections.
+MONGO_WARM_CONNECTIONS = int(os.environ.get('MONGO_WARM_CONNECTIONS', 0))
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT', 2.0))
+# Add reply bytes to each request's Server-Timing (re-encodes every reply; debugging and tests)
+ROUND_TRIP_BYTES = os.environ.get('ROUND_TRIP_BYTES', '0') == '1'
 
-# JWT and Password settings
+# JWT settings (password hashing lives in auth.py)
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Identity without MongoDB on the common path: verified tokens are kept until
+# they expire, /auth/me documents for USER_CACHE_TTL seconds (logins refresh them)
+token_verifier = TokenVerifier(SECRET_KEY, ALGORITHM, maxsize=int(os.environ.get('TOKEN_CACHE_SIZE', 10000)))
+user_cache = MemoryBackend(
+    maxsize=int(os.environ.get('USER_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('USER_CACHE_TTL', 30))
+)
+
+# Never send password hashes or search tokens back to clients
+HIDDEN_USER_FIELDS = {"password_hash": 0, "search_tokens": 0}
+USER_PROJECTION = {"_id": 0, **HIDDEN_USER_FIELDS}
+
+# Typeahead search: results per keystroke and the time budget for each query
+SEARCH_LIMIT = int(os.environ.get('SEARCH_LIMIT', 10))
+SEARCH_BUDGET_MS = int(os.environ.get('SEARCH_BUDGET_MS', 150))
+
+# Dashboard engine: "materialized" (student_gpa documents) or "aggregation" (join inside MongoDB)
+DASHBOARD_ENGINE = os.environ.get('DASHBOARD_ENGINE', 'materialized')
+
+# Subject catalog cache (per worker, kept coherent through the cache_versions collection)
+subjects_cache = VersionedCache(
+    "subjects",
+    MemoryBackend(
+        maxsize=int(os.environ.get('SUBJECTS_CACHE_SIZE', 1024)),
+        ttl=float(os.environ.get('SUBJECTS_CACHE_TTL', 300))
+    ),
+    check_interval=float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 1.0))
+)
+
+# Marks statistics, cached under the marks version of each subject involved
+analytics_cache = VersionedCache(
+    "analytics",
+    MemoryBackend(
+        maxsize=int(os.environ.get('ANALYTICS_CACHE_SIZE', 512)),
+        ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', 600))
+    )
+)
+
+# Identical concurrent dashboard/roster reads share one computation;
+# SINGLEFLIGHT_WINDOW > 0 also serves finished results for that many seconds
+SINGLEFLIGHT_WINDOW = float(os.environ.get('SINGLEFLIGHT_WINDOW', 0))
+dashboard_flight = SingleFlight("dashboard", SINGLEFLIGHT_WINDOW)
+students_flight = SingleFlight("students", SINGLEFLIGHT_WINDOW)
+
+REGISTRY.callback(
+    "identity_cache_entries", "Entries held by the verified-token and user caches", "gauge",
+    lambda: [(("token",), len(token_verifier)), (("user",), len(user_cache))],
+    labels=("cache",)
+)
+
+REGISTRY.callback(
+    "singleflight_inflight", "Distinct computations currently in flight", "gauge",
+    lambda: [((flight.name,), flight.inflight()) for flight in (dashboard_flight, students_flight)],
+    labels=("group",)
+)
+
+REGISTRY.callback(
+    "cache_requests_total", "Read-through cache lookups by result", "counter",
+    lambda: [
+        ((cache.namespace, result), count)
+        for cache in (subjects_cache, schemes_cache, analytics_cache)
+        for result, count in (("hit", cache.hits), ("miss", cache.misses))
+    ],
+    labels=("cache", "result")
+)
+
+# Bulk marks ingestion and roster imports
+MARKS_BULK_CHUNK_SIZE = int(os.environ.get('MARKS_BULK_CHUNK_SIZE', 500))
+ROSTER_CHUNK_SIZE = int(os.environ.get('ROSTER_CHUNK_SIZE', 1000))
+
+# Background jobs (subject deletion cascades, GPA recomputation); each app runs its own queue
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 2.0))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_BATCH_SIZE = int(os.environ.get('JOB_BATCH_SIZE', 1000))
+
+async def delete_subject_job(db, params: dict, job) -> dict:
+    """Remove a deleted subject's GPA entries and marks, in batches"""
+    subject = params["subject"]
+    students_updated = await remove_subject_from_gpa(db, subject)
+
+    query = {"subject_id": subject["id"]}
+    total = await db.marks.count_documents(query)
+    deleted = 0
+    while True:
+        batch = await db.marks.find(query, {"_id": 1, "student_id": 1}).limit(JOB_BATCH_SIZE).to_list(JOB_BATCH_SIZE)
+        if not batch:
+            break
+        result = await db.marks.delete_many({"_id": {"$in": [doc["_id"] for doc in batch]}})
+        deleted += result.deleted_count
+        await bump_data_versions(db, [doc["student_id"] for doc in batch])
+        await job.progress(deleted, total)
+
+    await bump_marks_versions(db, [subject["id"]])
+    return {"students_updated": students_updated, "marks_deleted": deleted}
+
+async def recompute_gpa_job(db, params: dict, job) -> dict:
+    rebuilt = await rebuild_department_gpa(db, params["department"], progress=job.progress)
+    return {"rebuilt_students": rebuilt}
+
+JOB_HANDLERS: Dict[str, Handler] = {
+    "delete_subject": delete_subject_job,
+    "recompute_gpa": recompute_gpa_job,
+}
+
 security = HTTPBearer()
 
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
+# Metrics and probes, outside /api and the OpenAPI schema
+ops_router = APIRouter(include_in_schema=False)
 
 # Models
 class UserRegister(BaseModel):
     name: str
     email: Optional[str] = None
     student_id: Optional[str] = None
+    password: Password
     role: str  # "teacher" or "student"
     department: str
     semester: Optional[int] = None  # For students only
@@ -95,7 +239,36 @@ class Marks(BaseModel):
     final_exam: Optional[float] = None
     updated_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class GradingSchemeUpdate(BaseModel):
+    weights: Dict[str, float] = Field(default_factory=lambda: {"final_exam": 1.0})
+    bands: List[Tuple[float, float]] = Field(default_factory=lambda: list(GRADE_BANDS))  # (minimum score, grade point)
+    fail_grade_point: float = FAIL_GRADE_POINT
+    pass_final_exam: Optional[float] = None
+    pass_score: Optional[float] = None
+
+class CohortDashboardRequest(BaseModel):
+    department: str
+    semester: Optional[int] = None
+    student_ids: Optional[List[str]] = Field(default=None, min_length=1, max_length=10000)  # roll numbers
+    all_students: bool = False  # the whole cohort instead of student_ids
+
+class SubjectPage(BaseModel):
+    items: List[Subject]
+    next_cursor: Optional[str] = None
+
 # Helper Functions
+def create_mongo_client(mongo_url: Optional[str] = None) -> AsyncIOMotorClient:
+    """A client with the metrics and round-trip listeners the app reports from"""
+    listener = RoundTripListener(measure_bytes=ROUND_TRIP_BYTES)
+    return create_client(mongo_url, event_listeners=[*MONGO_LISTENERS, listener])
+
+# The app's database and job queue, opened by its lifespan (async: no threadpool hop)
+async def get_db(request: Request) -> AsyncIOMotorDatabase:
+    return request.app.state.db
+
+async def get_job_queue(request: Request) -> JobQueue:
+    return request.app.state.job_queue
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -103,51 +276,80 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# async so FastAPI runs it on the event loop instead of a threadpool hop per request
+async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return token_verifier.decode(credentials.credentials)
     except jwt_exceptions.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt_exceptions.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def calculate_grade_point(marks: float) -> float:
-    """Convert marks to 10-point grade scale"""
-    if marks >= 90:
-        return 10.0
-    elif marks >= 80:
-        return 9.0
-    elif marks >= 70:
-        return 8.0
-    elif marks >= 60:
-        return 7.0
-    elif marks >= 50:
-        return 6.0
-    elif marks >= 40:
-        return 5.0
-    else:
-        return 0.0
+async def fetch_page(collection, query: dict, limit: int, after: Optional[str], projection: Optional[dict] = None) -> dict:
+    """One keyset page of `query` as {"items", "next_cursor"}"""
+    try:
+        return await paginate(collection, query, limit, after, projection)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def department_subjects(db, department: str) -> List[dict]:
+    """A department's subjects in creation order, from the subjects cache (shared: do not mutate)"""
+    async def load():
+        return await db.subjects.find({"department": department}, {"_id": 0}).sort("_id", 1).to_list(None)
+    
+    return await subjects_cache.get_or_load(db, ("department", department), load)
+
+def data_etag(kind: str, version: int, key=()) -> str:
+    """Strong ETag for a student's data at `version` (see gpa.py), per response kind and query"""
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return f'"{kind}-{version}-{digest}"'
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return None
+
+async def hash_or_503(operation):
+    """Await a password hash/verify, shedding load with 503 when the hasher is saturated"""
+    try:
+        return await operation
+    except HasherBusy as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many sign-ins in progress, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def marks_upsert(marks_data: MarksCreate):
+    """Build the (filter, update) pair that upserts one student's marks for a subject"""
+    key = {"student_id": marks_data.student_id, "subject_id": marks_data.subject_id}
+    update_data = marks_data.model_dump()
+    update_data['updated_at'] = datetime.now(timezone.utc)
+    update = {"$set": update_data, "$setOnInsert": {"id": str(uuid.uuid4())}}
+    return key, update
 
 # Auth Routes
 @api_router.post("/auth/register")
-async def register(user_data: UserRegister):
-    # Check if user exists
-    if user_data.role == "teacher":
-        existing = await db.users.find_one({"email": user_data.email})
-        if existing:
-            raise HTTPException(status_code=400, detail="Email already registered")
-    else:
-        existing = await db.users.find_one({"student_id": user_data.student_id})
-        if existing:
-            raise HTTPException(status_code=400, detail="Student ID already registered")
-    
-    user = User(**user_data.model_dump())
+async def register(user_data: UserRegister, db: AsyncIOMotorDatabase = Depends(get_db)):
+    user = User(**user_data.model_dump(exclude={"password"}))
     doc = user.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc["password_hash"] = await hash_or_503(hasher.hash(user_data.password))
+    if user.role == "student":
+        doc["search_tokens"] = search_tokens(doc)
     
-    await db.users.insert_one(doc)
+    # Uniqueness of email / student_id is enforced by the users indexes
+    try:
+        await db.users.insert_one(doc)
+    except DuplicateKeyError as e:
+        key_pattern = (e.details or {}).get("keyPattern", {})
+        field = next(iter(key_pattern), "email" if user_data.role == "teacher" else "student_id")
+        if field == "email":
+            raise HTTPException(status_code=400, detail="Email already registered")
+        raise HTTPException(status_code=400, detail="Student ID already registered")
+    
+    if user.role == "student":
+        await db.student_gpa.insert_one(empty_gpa_doc(doc))
     
     token_data = {"sub": user.id, "role": user.role}
     token = create_access_token(token_data)
@@ -155,148 +357,321 @@ async def register(user_data: UserRegister):
     return {"token": token, "user": user}
 
 @api_router.post("/auth/login")
-async def login(login_data: UserLogin):
-    # Simple password check
-    if login_data.password not in ["student", "teacher"]:
+async def login(login_data: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
+    # Teachers sign in with their email, students with their student ID
+    field = "email" if "@" in login_data.identifier else "student_id"
+    user_doc = await db.users.find_one({field: login_data.identifier}, {"_id": 0, "search_tokens": 0})
+    password_hash = user_doc.pop("password_hash", None) if user_doc else None
+    
+    valid, new_hash = await hash_or_503(hasher.verify(login_data.password, password_hash))
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    # Find user
-    if "@" in login_data.identifier:
-        user_doc = await db.users.find_one({"email": login_data.identifier}, {"_id": 0})
-        if not user_doc or login_data.password != "teacher":
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-    else:
-        user_doc = await db.users.find_one({"student_id": login_data.identifier}, {"_id": 0})
-        if not user_doc or login_data.password != "student":
-            raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    if isinstance(user_doc['created_at'], str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
+    # Stored with an outdated bcrypt cost; only replace the hash we verified against
+    if new_hash:
+        await db.users.update_one(
+            {"id": user_doc["id"], "password_hash": password_hash},
+            {"$set": {"password_hash": new_hash}}
+        )
     
     token_data = {"sub": user_doc['id'], "role": user_doc['role']}
     token = create_access_token(token_data)
     
+    # Signing in refreshes the cached profile with the document just read
+    user_cache.set(user_doc["id"], dumps(user_doc))
     return {"token": token, "user": user_doc}
 
 @api_router.get("/auth/me")
-async def get_current_user(token_data: dict = Depends(verify_token)):
-    user_doc = await db.users.find_one({"id": token_data["sub"]}, {"_id": 0})
+async def get_current_user(db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    body = user_cache.get(token_data["sub"])
+    if body is not MISSING:
+        IDENTITY_CACHE_REQUESTS.inc("user", "hit")
+        return fast_json(body)
+    
+    IDENTITY_CACHE_REQUESTS.inc("user", "miss")
+    user_doc = await db.users.find_one({"id": token_data["sub"]}, USER_PROJECTION)
     if not user_doc:
         raise HTTPException(status_code=404, detail="User not found")
     
-    if isinstance(user_doc['created_at'], str):
-        user_doc['created_at'] = datetime.fromisoformat(user_doc['created_at'])
-    
-    return user_doc
+    body = dumps(user_doc)
+    user_cache.set(token_data["sub"], body)
+    return fast_json(body)
 
 # Subject Routes
 @api_router.post("/subjects", response_model=Subject)
-async def create_subject(subject_data: SubjectCreate, token_data: dict = Depends(verify_token)):
+async def create_subject(subject_data: SubjectCreate, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
     if token_data["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create subjects")
     
-    # Check if subject code already exists
-    existing = await db.subjects.find_one({"code": subject_data.code, "semester": subject_data.semester})
-    if existing:
-        raise HTTPException(status_code=400, detail="Subject code already exists for this semester")
-    
     subject = Subject(**subject_data.model_dump())
     doc = subject.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     
-    await db.subjects.insert_one(doc)
+    # Code + semester uniqueness is enforced by the subjects indexes
+    try:
+        await db.subjects.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Subject code already exists for this semester")
+    
+    await subjects_cache.invalidate(db)
     return subject
 
-@api_router.get("/subjects", response_model=List[Subject])
-async def get_subjects(semester: Optional[int] = None, department: Optional[str] = None):
-    query = {}
-    if semester:
-        query["semester"] = semester
-    if department:
-        query["department"] = department
-    
-    subjects = await db.subjects.find(query, {"_id": 0}).to_list(1000)
-    
-    for subject in subjects:
-        if isinstance(subject['created_at'], str):
-            subject['created_at'] = datetime.fromisoformat(subject['created_at'])
+@api_router.get("/subjects", response_model=SubjectPage)
+async def get_subjects(request: Request, semester: Optional[int] = None, department: Optional[str] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db)):
+    key = ("list", semester, department, limit, after)
+    version = await subjects_cache.version(db)
+    etag = subjects_cache.etag(version, key)
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+    
+    async def load():
+        query = {}
+        if semester:
+            query["semester"] = semester
+        if department:
+            query["department"] = department
+        
+        # Cache the encoded page: hits skip both the query and serialization
+        return dumps(await fetch_page(db.subjects, query, limit, after))
     
-    return subjects
+    body = await subjects_cache.get_or_load(db, key, load, version)
+    return fast_json(body, headers=cache_headers)
 
 @api_router.delete("/subjects/{subject_id}")
-async def delete_subject(subject_id: str, token_data: dict = Depends(verify_token)):
+async def delete_subject(subject_id: str, db: AsyncIOMotorDatabase = Depends(get_db), jobs: JobQueue = Depends(get_job_queue), token_data: dict = Depends(verify_token)):
     if token_data["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can delete subjects")
     
-    result = await db.subjects.delete_one({"id": subject_id})
-    if result.deleted_count == 0:
+    # The document goes into the job's params, which are returned as JSON by GET /jobs
+    subject = await db.subjects.find_one_and_delete({"id": subject_id}, projection={"_id": 0})
+    if subject is None:
         raise HTTPException(status_code=404, detail="Subject not found")
     
-    return {"message": "Subject deleted successfully"}
+    await subjects_cache.invalidate(db)
+    # GPA entries and marks can run into the thousands; they are removed in the background
+    job = await jobs.enqueue("delete_subject", {"subject": subject})
+    
+    return {"message": "Subject deleted successfully", "job_id": job["id"]}
 
-# Marks Routes
-@api_router.post("/marks", response_model=Marks)
-async def create_or_update_marks(marks_data: MarksCreate, token_data: dict = Depends(verify_token)):
+# Grading Scheme Routes (department names may contain "/", e.g. "AI/ML")
+@api_router.get("/grading-schemes/{department:path}")
+async def get_grading_scheme(department: str, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    scheme = await get_scheme(db, department)
+    return {"department": department, "default": scheme is DEFAULT_SCHEME, **scheme.to_doc()}
+
+@api_router.put("/grading-schemes/{department:path}")
+async def update_grading_scheme(department: str, scheme_data: GradingSchemeUpdate, db: AsyncIOMotorDatabase = Depends(get_db), jobs: JobQueue = Depends(get_job_queue), token_data: dict = Depends(verify_token)):
     if token_data["role"] != "teacher":
-        raise HTTPException(status_code=403, detail="Only teachers can upload marks")
+        raise HTTPException(status_code=403, detail="Only teachers can change grading schemes")
     
-    # Check if marks already exist
-    existing = await db.marks.find_one({
-        "student_id": marks_data.student_id,
-        "subject_id": marks_data.subject_id
-    })
+    try:
+        scheme = GradingScheme(**scheme_data.model_dump())
+    except InvalidScheme as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    if existing:
-        # Update existing marks
-        update_data = marks_data.model_dump()
-        update_data['updated_at'] = datetime.now(timezone.utc).isoformat()
-        
-        await db.marks.update_one(
-            {"student_id": marks_data.student_id, "subject_id": marks_data.subject_id},
-            {"$set": update_data}
+    await save_scheme(db, department, scheme)
+    # Stored grade points were computed with the old scheme
+    job = await jobs.enqueue("recompute_gpa", {"department": department})
+    
+    return {"department": department, "default": False, **scheme.to_doc(), "job_id": job["id"]}
+
+# Marks Routes
+async def upsert_marks(db, key: dict, update: dict) -> dict:
+    try:
+        return await db.marks.find_one_and_update(
+            key, update, projection={"_id": 0}, upsert=True, return_document=ReturnDocument.AFTER
         )
-        
-        updated_doc = await db.marks.find_one(
-            {"student_id": marks_data.student_id, "subject_id": marks_data.subject_id},
-            {"_id": 0}
+    except DuplicateKeyError:
+        # A concurrent save inserted the same (student, subject) first; ours is now a plain update
+        return await db.marks.find_one_and_update(
+            key, update, projection={"_id": 0}, return_document=ReturnDocument.AFTER
         )
-        if isinstance(updated_doc['updated_at'], str):
-            updated_doc['updated_at'] = datetime.fromisoformat(updated_doc['updated_at'])
-        return updated_doc
-    else:
-        # Create new marks
-        marks = Marks(**marks_data.model_dump())
-        doc = marks.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        
-        await db.marks.insert_one(doc)
-        return marks
 
-@api_router.get("/marks/student/{student_id}")
-async def get_student_marks(student_id: str, token_data: dict = Depends(verify_token)):
-    marks_list = await db.marks.find({"student_id": student_id}, {"_id": 0}).to_list(1000)
+@api_router.post("/marks", response_model=Marks)
+async def create_or_update_marks(marks_data: MarksCreate, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can upload marks")
     
-    for marks in marks_list:
-        if isinstance(marks['updated_at'], str):
-            marks['updated_at'] = datetime.fromisoformat(marks['updated_at'])
+    # Two waves of two round trips: the atomic upsert alongside the subject and its
+    # grading scheme, then the single-update GPA patch alongside the statistics version bump.
+    key, update = marks_upsert(marks_data)
+    doc, (subject, scheme) = await asyncio.gather(
+        upsert_marks(db, key, update),
+        get_subject_with_scheme(db, marks_data.subject_id)
+    )
+    await asyncio.gather(
+        apply_marks_to_gpa(db, doc, subject, scheme),
+        bump_marks_versions(db, [marks_data.subject_id])
+    )
+    return doc
+
+async def write_marks_chunk(db, chunk, report: dict):
+    """Validate one chunk of marks rows and upsert the valid ones in a single unordered bulk_write"""
+    operations = []
+    row_numbers = []
+    student_ids = set()
+    subject_ids = set()
+    for row_number, row in chunk:
+        if isinstance(row, MalformedRow):
+            report["errors"].append({"row": row_number, "errors": [row.message]})
+            continue
+        try:
+            marks_data = MarksCreate.model_validate(row)
+        except ValidationError as e:
+            report["errors"].append({"row": row_number, "errors": validation_messages(e)})
+            continue
+        key, update = marks_upsert(marks_data)
+        operations.append(UpdateOne(key, update, upsert=True))
+        row_numbers.append(row_number)
+        student_ids.add(marks_data.student_id)
+        subject_ids.add(marks_data.subject_id)
+    
+    report["received"] += len(chunk)
+    if not operations:
+        return
     
-    return marks_list
+    try:
+        result = (await db.marks.bulk_write(operations, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        result = e.details
+        for error in result.get("writeErrors", []):
+            report["errors"].append({"row": row_numbers[error["index"]], "errors": [error.get("errmsg", "write failed")]})
+    
+    report["upserted"] += result.get("nUpserted", 0)
+    report["modified"] += result.get("nModified", 0)
+    
+    # One batched rebuild per chunk instead of one GPA patch per row
+    await refresh_students_gpa(db, student_ids)
+    await bump_marks_versions(db, subject_ids)
+
+@api_router.post("/marks/bulk")
+async def bulk_upsert_marks(
+    request: Request,
+    chunk_size: int = Query(MARKS_BULK_CHUNK_SIZE, ge=1, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    """Upsert many marks rows from a JSON array body or a multipart CSV/XLSX `file` upload"""
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can upload marks")
+    
+    chunks = await tabular_chunks(request, chunk_size, "marks")
+    report = {"received": 0, "upserted": 0, "modified": 0, "errors": []}
+    try:
+        async for chunk in chunks:
+            await write_marks_chunk(db, chunk, report)
+    except UploadFormatError as e:
+        if not report["received"]:
+            raise HTTPException(status_code=400, detail=str(e))
+        record_abort(report, e)
+    
+    report["failed"] = len(report["errors"])
+    return report
+
+async def tabular_chunks(request: Request, chunk_size: int, what: str):
+    """Row chunks from a multipart CSV/XLSX `file` upload or a JSON array body"""
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(status_code=400, detail="Expected a CSV or XLSX file in the 'file' field")
+        return iter_upload_chunks(upload, chunk_size)
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Body must be a JSON array of {what}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail=f"Body must be a JSON array of {what}")
+    return iter_json_chunks(rows, chunk_size)
+
+@api_router.get("/marks/student/{student_id}")
+async def get_student_marks(request: Request, student_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    # Read before the marks: a write landing in between only makes the ETag older than the body
+    version = await get_data_version(db, {"student_id": student_id})
+    headers = None
+    if version is not None:
+        etag = data_etag("marks", version, (limit, after))
+        unchanged = not_modified(request, etag)
+        if unchanged:
+            return unchanged
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    
+    return fast_json(await fetch_page(db.marks, {"student_id": student_id}, limit, after), headers=headers)
 
 @api_router.get("/marks/subject/{subject_id}")
-async def get_subject_marks(subject_id: str, token_data: dict = Depends(verify_token)):
+async def get_subject_marks(subject_id: str, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
     if token_data["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can view all marks")
     
-    marks_list = await db.marks.find({"subject_id": subject_id}, {"_id": 0}).to_list(1000)
+    return fast_json(await fetch_page(db.marks, {"subject_id": subject_id}, limit, after))
+
+# Analytics Routes
+@api_router.get("/analytics/subject/{subject_id}")
+async def get_subject_analytics(subject_id: str, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view analytics")
+    
+    subject = await db.subjects.find_one({"id": subject_id}, {"_id": 0})
+    if subject is None:
+        raise HTTPException(status_code=404, detail="Subject not found")
+    scheme = await get_scheme(db, subject["department"])
+    version = (await marks_versions(db, [subject_id]), scheme.cache_key)
     
-    for marks in marks_list:
-        if isinstance(marks['updated_at'], str):
-            marks['updated_at'] = datetime.fromisoformat(marks['updated_at'])
+    async def load():
+        return dumps(await subject_statistics(db, subject, scheme))
     
-    return marks_list
+    return fast_json(await analytics_cache.get_or_load(db, ("subject", subject_id), load, version))
+
+@api_router.get("/analytics/department/{department:path}")
+async def get_department_analytics(department: str, semester: Optional[int] = None, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view analytics")
+    
+    subjects, scheme = await asyncio.gather(department_subjects(db, department), get_scheme(db, department))
+    if semester:
+        subjects = [subject for subject in subjects if subject["semester"] == semester]
+    # Adding or deleting a subject changes the version too
+    version = (await marks_versions(db, [subject["id"] for subject in subjects]), scheme.cache_key)
+    
+    async def load():
+        return dumps(await department_statistics(db, department, subjects, scheme))
+    
+    return fast_json(await analytics_cache.get_or_load(db, ("department", department, semester), load, version))
+
+@api_router.post("/students/import")
+async def import_students(
+    request: Request,
+    department: Optional[str] = Query(None, description="Used for rows without a department"),
+    chunk_size: int = Query(ROSTER_CHUNK_SIZE, ge=1, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    """Register many students from a CSV/XLSX roster upload or a JSON array body"""
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can import students")
+    
+    chunks = await tabular_chunks(request, chunk_size, "students")
+    try:
+        return await import_roster(db, chunks, department)
+    except UploadFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/students/search")
+async def search_students_route(
+    q: str = Query(..., min_length=1, max_length=100),
+    department: Optional[str] = None,
+    limit: int = Query(SEARCH_LIMIT, ge=1, le=50),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    """Typeahead: students whose name or student ID starts with (or closely resembles) `q`"""
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can search students")
+    
+    return fast_json({"items": await search_students(db, q, department, limit, SEARCH_BUDGET_MS)})
 
 @api_router.get("/students")
-async def get_students(department: Optional[str] = None, semester: Optional[int] = None, token_data: dict = Depends(verify_token)):
+async def get_students(department: Optional[str] = None, semester: Optional[int] = None, limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), after: Optional[str] = None, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
     if token_data["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can view students")
     
@@ -306,80 +681,185 @@ async def get_students(department: Optional[str] = None, semester: Optional[int]
     if semester:
         query["semester"] = semester
     
-    students = await db.users.find(query, {"_id": 0}).to_list(1000)
-    
-    for student in students:
-        if isinstance(student['created_at'], str):
-            student['created_at'] = datetime.fromisoformat(student['created_at'])
+    async def load():
+        return dumps(await fetch_page(db.users, query, limit, after, HIDDEN_USER_FIELDS))
     
-    return students
+    return fast_json(await students_flight.do((db.name, department, semester, limit, after), load))
 
 @api_router.get("/dashboard/student/{student_id}")
-async def get_student_dashboard(student_id: str, token_data: dict = Depends(verify_token)):
-    # Get student info
-    student = await db.users.find_one({"student_id": student_id}, {"_id": 0})
+async def get_student_dashboard(request: Request, student_id: str, db: AsyncIOMotorDatabase = Depends(get_db), token_data: dict = Depends(verify_token)):
+    # Polling clients get their 304 from one indexed student_gpa lookup
+    version = await get_data_version(db, {"roll_number": student_id})
+    if version is not None:
+        unchanged = not_modified(request, data_etag("dashboard", version))
+        if unchanged:
+            return unchanged
+    
+    etag, body = await dashboard_flight.do((db.name, student_id), lambda: build_dashboard(db, student_id, version))
+    headers = {"ETag": etag, "Cache-Control": "no-cache"} if etag else None
+    return fast_json(body, headers=headers)
+
+async def build_dashboard(db, student_id: str, version: Optional[int]) -> Tuple[Optional[str], bytes]:
+    """(ETag, encoded dashboard); the ETag is None when the data version is not known
+
+    `version` is the data version read before the build; the aggregation engine tags
+    with it (read before the data, it can only be older than what is served).
+    """
+    if DASHBOARD_ENGINE == "aggregation":
+        student = await db.users.find_one({"student_id": student_id}, USER_PROJECTION)
+    else:
+        # Both reads are keyed by the roll number, so they go out together
+        student, gpa_doc = await asyncio.gather(
+            db.users.find_one({"student_id": student_id}, USER_PROJECTION),
+            db.student_gpa.find_one({"roll_number": student_id}, {"_id": 0})
+        )
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    # Get all marks using the student's database ID
-    marks_list = await db.marks.find({"student_id": student["id"]}, {"_id": 0}).to_list(1000)
-    
-    # Get all subjects
-    all_subjects = await db.subjects.find({"department": student["department"]}, {"_id": 0}).to_list(1000)
-    
-    # Calculate SGPA for each semester and overall CGPA
-    semester_data = {}
-    
-    for sem in range(1, 9):
-        sem_subjects = [s for s in all_subjects if s["semester"] == sem]
-        sem_marks = [m for m in marks_list if m["semester"] == sem]
-        
-        total_credits = 0
-        total_grade_points = 0
-        subjects_with_marks = []
-        
-        for subject in sem_subjects:
-            mark_entry = next((m for m in sem_marks if m["subject_id"] == subject["id"]), None)
-            
-            if mark_entry and mark_entry.get("final_exam") is not None:
-                final_marks = mark_entry["final_exam"]
-                grade_point = calculate_grade_point(final_marks)
-                
-                total_credits += subject["credits"]
-                total_grade_points += grade_point * subject["credits"]
-                
-                subjects_with_marks.append({
-                    "subject": subject,
-                    "marks": mark_entry,
-                    "grade_point": grade_point
-                })
-        
-        sgpa = total_grade_points / total_credits if total_credits > 0 else 0
-        
-        semester_data[f"semester_{sem}"] = {
-            "semester": sem,
-            "sgpa": round(sgpa, 2),
-            "subjects": subjects_with_marks,
-            "total_credits": total_credits
-        }
-    
-    # Calculate overall CGPA
-    total_credits_all = 0
-    total_grade_points_all = 0
+    if DASHBOARD_ENGINE == "aggregation":
+        scheme = await get_scheme(db, student["department"])
+        semester_data, cgpa = await aggregate_semester_data(db, student, scheme)
+    else:
+        # SGPA/CGPA are materialized per student and kept current by marks/subject writes
+        if gpa_doc is None:
+            # Students that predate materialization: build it now (see `manage.py recompute-gpa`)
+            gpa_doc = (await rebuild_student_gpa(db, [student]))[0]
+            version = None
+        else:
+            version = data_version(gpa_doc)
+        semester_data, cgpa = semester_data_from_gpa(gpa_doc)
+    
+    etag = data_etag("dashboard", version) if version is not None else None
+    return etag, dumps({
+        "student": student,
+        "semester_data": semester_data,
+        "cgpa": cgpa
+    })
+
+@api_router.post("/dashboard/batch")
+async def get_cohort_dashboards(
+    request_data: CohortDashboardRequest,
+    batch_size: int = Query(200, ge=1, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    """Stream one dashboard per student of a cohort as NDJSON"""
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view cohort dashboards")
+    if request_data.all_students == (request_data.student_ids is not None):
+        raise HTTPException(status_code=400, detail="Pass either student_ids or all_students=true")
+    
+    return StreamingResponse(
+        stream_cohort_dashboards(db, request_data.department, request_data.semester, request_data.student_ids, batch_size),
+        media_type=MEDIA_TYPES["ndjson"]
+    )
+
+# Export Routes
+def export_response(chunks, format: str, filename: str) -> StreamingResponse:
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    )
+
+@api_router.get("/export/marks")
+async def export_marks(
+    subject_id: Optional[str] = None,
+    semester: Optional[int] = None,
+    department: Optional[str] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(500, ge=1, le=5000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can export marks")
+    if not (subject_id or semester or department):
+        raise HTTPException(status_code=400, detail="Filter by subject_id, semester or department")
     
-    for sem_key, sem_info in semester_data.items():
-        total_credits_all += sem_info["total_credits"]
-        total_grade_points_all += sem_info["sgpa"] * sem_info["total_credits"]
+    query = await marks_query(db, subject_id, semester, department)
+    return export_response(stream_marks(db, query, format, batch_size), format, "marks")
+
+@api_router.get("/export/transcripts")
+async def export_transcripts(
+    department: str,
+    semester: Optional[int] = None,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    batch_size: int = Query(200, ge=1, le=2000),
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    token_data: dict = Depends(verify_token)
+):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can export transcripts")
     
-    cgpa = total_grade_points_all / total_credits_all if total_credits_all > 0 else 0
+    return export_response(stream_transcripts(db, department, semester, format, batch_size), format, "transcripts")
+
+# Job Routes
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str, jobs: JobQueue = Depends(get_job_queue), token_data: dict = Depends(verify_token)):
+    if token_data["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can view jobs")
     
-    return {
-        "student": student,
-        "semester_data": semester_data,
-        "cgpa": round(cgpa, 2)
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@ops_router.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@ops_router.get("/healthz")
+async def healthz():
+    """Liveness: the process is serving requests (no database access)"""
+    return {"status": "ok"}
+
+@ops_router.get("/readyz")
+async def readyz(request: Request):
+    """Readiness: startup finished and MongoDB answers a ping; reports pool utilisation"""
+    client = getattr(request.app.state, "client", None)
+    max_size = client.options.pool_options.max_pool_size if client is not None else None
+    in_use = MONGO_POOL_CONNECTIONS.value("in_use")
+    report = {
+        "status": "ready",
+        "pool": {
+            "open": MONGO_POOL_CONNECTIONS.value("open"),
+            "in_use": in_use,
+            "max_size": max_size,
+            "utilisation": round(in_use / max_size, 3) if max_size else None,
+        },
     }
+    if not getattr(request.app.state, "ready", False):
+        return fast_json({**report, "status": "starting"}, status_code=503)
+    
+    started = time.perf_counter()
+    try:
+        with pymongo.timeout(READY_PING_TIMEOUT):
+            await client.admin.command("ping")
+    except PyMongoError as e:
+        return fast_json({**report, "status": "unavailable", "error": str(e)}, status_code=503)
+    report["ping_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return fast_json(report)
 
-app.include_router(api_router)
+# Most MongoDB round trips each route may make (getMore included). Every
+# response reports its usage in Server-Timing; ROUND_TRIP_BUDGETS=enforce
+# (test mode) turns a request over budget into a 500 instead of a warning.
+ROUTE_ROUND_TRIP_BUDGETS = {
+    ("POST", "/api/auth/register"): 2,
+    ("POST", "/api/auth/login"): 2,
+    ("GET", "/api/auth/me"): 1,
+    ("GET", "/api/subjects"): 3,
+    # upsert + subject/scheme, then GPA patch + statistics version; a mark for a subject
+    # outside the student's department bumps their data version separately
+    ("POST", "/api/marks"): 5,
+    ("GET", "/api/marks/student/{student_id}"): 3,
+    ("GET", "/api/students"): 2,
+    # exact student ID and prefix queries together, then the fuzzy top-up
+    ("GET", "/api/students/search"): 3,
+    # version, then user and student_gpa together; the aggregation engine reads the user, the
+    # grading scheme (cache version check and load) and runs its pipeline instead
+    ("GET", "/api/dashboard/student/{student_id}"): 3 if DASHBOARD_ENGINE == "materialized" else 5,
+}
 
 # CORS configuration
 _cors_origins_raw = os.environ.get('CORS_ORIGINS', '*')
@@ -387,20 +867,79 @@ _cors_origins = [o.strip() for o in _cors_origins_raw.split(',') if o.strip()]
 # When allowing all origins ("*"), credentials must be disabled per CORS spec
 _allow_credentials = False if _cors_origins == ['*'] else True
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=_allow_credentials,
-    allow_origins=_cors_origins,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # A client passed to create_app belongs to the caller, who also closes it
+    client = app.state.client
+    owned = client is None
+    if owned:
+        client = app.state.client = create_mongo_client()
+    db = app.state.db = client[app.state.db_name or os.environ['DB_NAME']]
+    job_queue = app.state.job_queue = JobQueue(
+        db,
+        handlers=JOB_HANDLERS,
+        concurrency=JOB_CONCURRENCY,
+        poll_interval=JOB_POLL_INTERVAL,
+        lease=JOB_LEASE_SECONDS
+    )
+    
+    # Connections first, so index checks and the first requests do not pay the handshakes
+    await warm_pool(client, MONGO_WARM_CONNECTIONS or client.options.pool_options.min_pool_size or 4)
+    # Missing indexes are created; drifted ones are only reported, since dropping and
+    # rebuilding a large index under live traffic is left to `manage.py ensure-indexes`
+    await ensure_indexes(db, drop_stale=False)
+    job_queue.start()
+    app.state.ready = True
+    try:
+        yield
+    finally:
+        app.state.ready = False
+        await job_queue.stop()
+        if owned:
+            client.close()
+            app.state.client = None
+        hasher.shutdown()
+
+def create_app(client: Optional[AsyncIOMotorClient] = None, db_name: Optional[str] = None) -> FastAPI:
+    """The API app; its lifespan opens a MongoDB client unless one is passed in (tests, benchmarks)
+
+    An injected client should come from `create_mongo_client` so metrics and
+    round-trip budgets see its commands. `db_name` defaults to DB_NAME.
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.state.ready = False
+    app.state.client = client
+    app.state.db_name = db_name
+    app.include_router(api_router)
+    app.include_router(ops_router)
+    
+    # Every MongoDB call of an API request shares one deadline (maxTimeMS is the
+    # time remaining); running out answers 503. Streaming and upload routes are exempt.
+    app.add_middleware(
+        DeadlineMiddleware,
+        seconds=float(os.environ.get('REQUEST_DEADLINE_SECONDS', 5)),
+        exempt_prefixes=("/api/export/", "/api/dashboard/batch", "/api/marks/bulk", "/api/students/import"),
+        retry_after=int(os.environ.get('REQUEST_DEADLINE_RETRY_AFTER', 1))
+    )
+    app.add_middleware(
+        RoundTripMiddleware,
+        budgets=ROUTE_ROUND_TRIP_BUDGETS,
+        enforce=os.environ.get('ROUND_TRIP_BUDGETS', 'warn') == 'enforce'
+    )
+    app.add_middleware(MetricsMiddleware)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=_allow_credentials,
+        allow_origins=_cors_origins,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    return app
+
+app = create_app()
@@ -0,0 +1,73 @@
+"""Single-flight coalescing of identical concurrent reads.
+
+When hundreds of clients ask for the same thing at once (results day), only
+the first request runs the database work; the others await the same task and
+share its result. Optionally, a finished result is kept for a short `window`
+so a burst arriving just after it completes is served from memory too.
+
+Shared results go to many responses at once, so callers should return
+immutable values (typically serialized bytes).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import REGISTRY
+
+SINGLEFLIGHT_REQUESTS = REGISTRY.counter(
+    "singleflight_requests_total",
+    "Coalesced reads by result: leader ran the work, shared joined it in flight, cached hit the window",
+    ("group", "result"))
+
+
+class SingleFlight:
+    def __init__(self, name: str, window: float = 0.0, maxsize: int = 4096):
+        self.name = name
+        self.window = window
+        self.maxsize = maxsize
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self._recent: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _cached(self, key: Hashable) -> Any:
+        entry = self._recent.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._recent[key]
+            return None
+        return entry
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            # Errors are delivered to the waiters, never cached
+            return
+        if self.window > 0:
+            self._recent[key] = (time.monotonic() + self.window, task.result())
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.maxsize:
+                self._recent.popitem(last=False)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of `fn()`, shared with every concurrent call for the same key"""
+        if self.window > 0:
+            entry = self._cached(key)
+            if entry is not None:
+                SINGLEFLIGHT_REQUESTS.inc(self.name, "cached")
+                return entry[1]
+
+        task = self._inflight.get(key)
+        if task is None:
+            SINGLEFLIGHT_REQUESTS.inc(self.name, "leader")
+            # A task of its own, so one client disconnecting does not cancel the work for the rest
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            SINGLEFLIGHT_REQUESTS.inc(self.name, "shared")
+        return await asyncio.shield(task)
+
+    def inflight(self) -> int:
+        return len(self._inflight)
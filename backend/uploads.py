@@ -0,0 +1,154 @@
+"""Chunked readers for tabular uploads (CSV / XLSX / JSON arrays)"""
+import csv
+import zipfile
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import UploadFile
+
+
+class MalformedRow:
+    """A source row that does not fit the header; reported instead of being guessed at"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+# (row_number, row) where row_number is the 1-based line in the source file
+Row = Tuple[int, Union[Dict[str, Optional[str]], MalformedRow]]
+
+
+class UploadFormatError(ValueError):
+    """The upload is not a CSV/XLSX file we can read"""
+
+    def __init__(self, message: str, line: Optional[int] = None):
+        super().__init__(message)
+        # Source line the reader stopped at, when it got past the header
+        self.line = line
+
+
+def validation_messages(error) -> List[str]:
+    """One "field: message" line per problem in a pydantic ValidationError"""
+    return [f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}" for err in error.errors()]
+
+
+def record_abort(report: dict, error: UploadFormatError) -> None:
+    """Close the row report of an upload that turned unreadable part-way; earlier rows are already written"""
+    report["aborted"] = True
+    where = f"line {error.line}" if error.line else "an unknown line"
+    report["errors"].append({"row": error.line, "errors": [f"Upload aborted at {where}, later rows were not read: {error}"]})
+
+
+def _clean(row: dict) -> Dict[str, Optional[str]]:
+    # Blank cells mean "no value", not an empty string
+    cleaned = {}
+    for key, value in row.items():
+        if key is None:
+            continue
+        if isinstance(value, str):
+            value = value.strip() or None
+        cleaned[str(key).strip()] = value
+    return cleaned
+
+
+def _decoded_lines(upload: UploadFile) -> Iterator[str]:
+    # Decode line by line so a bad byte is reported against the line it is on
+    for number, raw in enumerate(upload.file, 1):
+        try:
+            yield raw.decode("utf-8-sig" if number == 1 else "utf-8")
+        except UnicodeDecodeError:
+            raise UploadFormatError(f"CSV must be UTF-8 encoded (invalid bytes on line {number})", number)
+
+
+def _csv_records(upload: UploadFile) -> Iterator[Row]:
+    reader = csv.reader(_decoded_lines(upload))
+    header = next(reader, None)
+    if not header:
+        return
+    line = reader.line_num
+    try:
+        for values in reader:
+            # A quoted cell can span lines; number the row by its first line
+            row_number, line = line + 1, reader.line_num
+            if not any(value.strip() for value in values):
+                continue
+            if any(value.strip() for value in values[len(header):]):
+                yield row_number, MalformedRow(f"row: expected {len(header)} cells, found {len(values)}")
+                continue
+            # Short rows leave the trailing columns blank
+            yield row_number, _clean(dict(zip(header, values)))
+    except csv.Error as e:
+        raise UploadFormatError(f"Could not parse CSV near line {reader.line_num}: {e}", reader.line_num)
+
+
+def _csv_chunks(upload: UploadFile, chunk_size: int) -> Iterator[List[Row]]:
+    chunk = []
+    try:
+        for record in _csv_records(upload):
+            chunk.append(record)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    except UploadFormatError:
+        # Hand over the rows read before the bad line, then stop
+        if chunk:
+            yield chunk
+        raise
+    if chunk:
+        yield chunk
+
+
+def _xlsx_chunks(upload: UploadFile, chunk_size: int) -> Iterator[List[Row]]:
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+
+    # read_only mode streams rows from the sheet XML instead of building the workbook in memory
+    try:
+        workbook = load_workbook(upload.file, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException, KeyError) as e:
+        # KeyError: a zip archive without the workbook parts
+        raise UploadFormatError(f"Could not read XLSX file: {e}")
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if not header:
+            return
+        numbered = enumerate(rows, start=2)
+        while True:
+            chunk = [(n, _clean(dict(zip(header, values)))) for n, values in islice(numbered, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        workbook.close()
+
+
+def _chunks_for(upload: UploadFile, chunk_size: int) -> Iterator[List[Row]]:
+    filename = (upload.filename or "").lower()
+    content_type = upload.content_type or ""
+    if filename.endswith(".xlsx") or "spreadsheetml" in content_type:
+        return _xlsx_chunks(upload, chunk_size)
+    if filename.endswith(".csv") or content_type in ("text/csv", "application/vnd.ms-excel"):
+        return _csv_chunks(upload, chunk_size)
+    raise UploadFormatError("Upload must be a .csv or .xlsx file")
+
+
+async def iter_upload_chunks(upload: UploadFile, chunk_size: int) -> AsyncIterator[List[Row]]:
+    """Yield the rows of an uploaded CSV/XLSX file, `chunk_size` rows at a time.
+
+    Parsing happens in the threadpool one chunk at a time, so neither the event
+    loop nor memory ever has to deal with the whole file.
+    """
+    chunks = _chunks_for(upload, chunk_size)
+    while True:
+        chunk = await run_in_threadpool(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def iter_json_chunks(rows: list, chunk_size: int) -> AsyncIterator[List[Row]]:
+    """Yield an already-decoded JSON array in the same chunked shape as uploads"""
+    for start in range(0, len(rows), chunk_size):
+        yield [(start + offset + 1, row) for offset, row in enumerate(rows[start:start + chunk_size])]
@@ -1,6 +1,8 @@
 import requests
+import re
 import sys
 import json
+import time
 from datetime import datetime
 
 class StudentMarksAPITester:
@@ -80,6 +82,7 @@ class StudentMarksAPITester:
         teacher_data = {
             "name": "Dr. John Smith",
             "email": f"teacher_{datetime.now().strftime('%H%M%S')}@aiml.edu",
+            "password": "teacher-pass-1",
             "role": "teacher",
             "department": "AI/ML"
         }
@@ -103,6 +106,7 @@ class StudentMarksAPITester:
         student_data = {
             "name": "Alice Johnson",
             "student_id": f"STU{datetime.now().strftime('%H%M%S')}",
+            "password": "student-pass-1",
             "role": "student",
             "department": "AI/ML",
             "semester": 3
@@ -126,7 +130,7 @@ class StudentMarksAPITester:
         """Test teacher login"""
         login_data = {
             "identifier": email,
-            "password": "teacher"
+            "password": "teacher-pass-1"
         }
         
         success, response = self.run_test(
@@ -146,7 +150,7 @@ class StudentMarksAPITester:
         """Test student login"""
         login_data = {
             "identifier": student_id,
-            "password": "student"
+            "password": "student-pass-1"
         }
         
         success, response = self.run_test(
@@ -162,6 +166,17 @@ class StudentMarksAPITester:
             return True
         return False
 
+    def test_wrong_password_login(self, student_id):
+        """Test login with a wrong password is rejected"""
+        success, _ = self.run_test(
+            "Login With Wrong Password",
+            "POST",
+            "auth/login",
+            401,
+            data={"identifier": student_id, "password": "not-the-password"}
+        )
+        return success
+
     def test_auth_me(self, token, role):
         """Test get current user"""
         headers = {'Authorization': f'Bearer {token}'}
@@ -174,6 +189,25 @@ class StudentMarksAPITester:
         )
         return success, response
 
+    def test_round_trip_report(self, token):
+        """Test that responses report their MongoDB usage in Server-Timing"""
+        print("\n🔍 Testing Round Trip Report...")
+        response = requests.get(f"{self.api_url}/auth/me", headers={'Authorization': f'Bearer {token}'})
+        timing = response.headers.get('Server-Timing', '')
+        match = re.fullmatch(r'mongo;dur=(\d+\.\d{2});desc="(\d+) commands, (\d+) docs(?:, \d+\.\d KiB)?"', timing)
+        if response.status_code != 200 or not match:
+            self.log_test("Round Trip Report", False, f"Unexpected Server-Timing: {timing!r}")
+            return False
+
+        # /auth/me has a budget of one round trip (none when the profile is cached)
+        commands, docs = int(match.group(2)), int(match.group(3))
+        if commands > 1 or docs > commands:
+            self.log_test("Round Trip Report", False, f"{commands} commands, {docs} docs for /auth/me")
+            return False
+        print(f"   Server-Timing: {timing}")
+        self.log_test("Round Trip Report", True)
+        return True
+
     def test_create_subject(self):
         """Test creating a subject"""
         if not self.teacher_token:
@@ -252,6 +286,41 @@ class StudentMarksAPITester:
         )
         return success, response
 
+    def test_bulk_upload_marks(self, student_id, subject_id):
+        """Test bulk marks upload with one valid and one invalid row"""
+        if not self.teacher_token:
+            self.log_test("Bulk Upload Marks", False, "No teacher token available")
+            return False, {}
+
+        rows = [
+            {
+                "student_id": student_id,
+                "subject_id": subject_id,
+                "semester": 3,
+                "internal1": 35.0,
+                "internal2": 38.0,
+                "internal3": 40.0,
+                "final_exam": 85.0
+            },
+            {"student_id": student_id, "semester": "not-a-number"}
+        ]
+
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+        success, response = self.run_test(
+            "Bulk Upload Marks",
+            "POST",
+            "marks/bulk",
+            200,
+            data=rows,
+            headers=headers
+        )
+
+        if success:
+            print(f"   Received: {response.get('received')}, failed: {response.get('failed')}")
+            if response.get('failed') != 1 or response['errors'][0].get('row') != 2:
+                self.log_test("Bulk Upload Error Report", False, f"Unexpected report: {response}")
+        return success, response
+
     def test_get_student_marks(self, student_id):
         """Test getting student marks"""
         if not self.student_token:
@@ -307,6 +376,181 @@ class StudentMarksAPITester:
         
         return success, response
 
+    def test_get_grading_scheme(self, department):
+        """Test the department grading scheme (the default banding unless one was saved)"""
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+        success, response = self.run_test(
+            "Get Grading Scheme",
+            "GET",
+            f"grading-schemes/{department}",
+            200,
+            headers=headers
+        )
+
+        if success:
+            print(f"   Default: {response.get('default')}, bands: {len(response.get('bands', []))}")
+        return success, response
+
+    def test_subject_analytics(self, subject_id):
+        """Test subject statistics after marks were uploaded"""
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+        success, response = self.run_test(
+            "Subject Analytics",
+            "GET",
+            f"analytics/subject/{subject_id}",
+            200,
+            headers=headers
+        )
+
+        if success:
+            print(f"   Graded: {response.get('count')}, pass rate: {response.get('pass_rate')}")
+            if not response.get('count'):
+                self.log_test("Subject Analytics Count", False, "Uploaded marks are missing from the statistics")
+        return success, response
+
+    def test_import_students(self, student_data):
+        """Test roster import with one new student and one duplicate student ID"""
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+        rows = [
+            {"name": "Roster Student", "student_id": f"RST{datetime.now().strftime('%H%M%S')}", "semester": 1},
+            {"name": "Duplicate", "student_id": student_data['student_id'], "semester": 1}
+        ]
+        success, response = self.run_test(
+            "Import Students",
+            "POST",
+            f"students/import?department={student_data['department']}",
+            200,
+            data=rows,
+            headers=headers
+        )
+
+        if success:
+            print(f"   Accepted: {response.get('accepted')}, duplicate: {response.get('duplicate')}")
+            if response.get('accepted') != 1 or response.get('duplicate') != 1:
+                self.log_test("Import Students Report", False, f"Unexpected report: {response}")
+        return success, response
+
+    def test_search_students(self, student_data):
+        """Test typeahead search finds a student by a prefix of their name"""
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+        prefix = student_data['name'].split()[0][:3]
+        success, response = self.run_test(
+            "Search Students",
+            "GET",
+            f"students/search?q={prefix}&department={student_data['department']}",
+            200,
+            headers=headers
+        )
+
+        if success:
+            found = [item['student_id'] for item in response.get('items', [])]
+            print(f"   '{prefix}' matched {len(found)} student(s)")
+            if student_data['student_id'] not in found and len(found) < 10:
+                self.log_test("Search Students Result", False, f"{student_data['student_id']} not in {found}")
+        return success, response
+
+    def test_subjects_not_modified(self):
+        """Test that the subject list answers 304 to its ETag until a subject is created or deleted"""
+        if not self.teacher_token:
+            self.log_test("Subjects Not Modified", False, "No teacher token available")
+            return False
+
+        print("\n🔍 Testing Subjects Not Modified...")
+        # A department of its own, so the throwaway subject is on the first page
+        department = f"ETAG-{datetime.now().strftime('%H%M%S%f')}"
+        url = f"{self.api_url}/subjects?department={department}"
+        headers = {'Authorization': f'Bearer {self.teacher_token}'}
+
+        def listed(etag=None):
+            response = requests.get(url, headers={'If-None-Match': etag} if etag else None)
+            ids = [subject['id'] for subject in response.json()['items']] if response.status_code == 200 else None
+            return response.status_code, response.headers.get('ETag'), ids
+
+        status, etag, _ = listed()
+        if status != 200 or not etag or listed(etag)[0] != 304:
+            self.log_test("Subjects Not Modified", False, f"No 304 for an unchanged list (ETag {etag!r})")
+            return False
+
+        subject = requests.post(f"{self.api_url}/subjects", headers=headers, json={
+            "name": "ETag Check", "code": department, "semester": 1, "credits": 1, "department": department
+        }).json()
+        # Other workers re-read the cache version at most once a second
+        time.sleep(1.5)
+        status, etag, ids = listed(etag)
+        if status != 200 or subject.get('id') not in ids:
+            self.log_test("Subjects Not Modified", False, f"Stale list after create_subject: {status} {ids}")
+            return False
+
+        requests.delete(f"{self.api_url}/subjects/{subject['id']}", headers=headers)
+        time.sleep(1.5)
+        status, _, ids = listed(etag)
+        if status != 200 or ids:
+            self.log_test("Subjects Not Modified", False, f"Stale list after delete_subject: {status} {ids}")
+            return False
+
+        self.log_test("Subjects Not Modified", True)
+        return True
+
+    def test_dashboard_not_modified(self, student_data):
+        """Test that polling the dashboard with its ETag answers 304"""
+        if not self.student_token:
+            self.log_test("Dashboard Not Modified", False, "No student token available")
+            return False
+
+        print("\n🔍 Testing Dashboard Not Modified...")
+        url = f"{self.api_url}/dashboard/student/{student_data['student_id']}"
+        headers = {'Authorization': f'Bearer {self.student_token}'}
+        etag = requests.get(url, headers=headers).headers.get('ETag')
+        if not etag:
+            self.log_test("Dashboard Not Modified", False, "No ETag on the dashboard")
+            return False
+
+        response = requests.get(url, headers={**headers, 'If-None-Match': etag})
+        if response.status_code != 304:
+            self.log_test("Dashboard Not Modified", False, f"Expected 304, got {response.status_code}")
+            return False
+
+        print(f"   ETag: {etag}")
+        self.log_test("Dashboard Not Modified", True)
+        return True
+
+    def test_cohort_dashboards(self, student_data):
+        """Test the batch dashboard stream for a student's cohort"""
+        if not self.teacher_token:
+            self.log_test("Cohort Dashboards", False, "No teacher token available")
+            return False, []
+
+        print("\n🔍 Testing Cohort Dashboards...")
+        response = requests.post(
+            f"{self.api_url}/dashboard/batch",
+            json={"department": student_data['department'], "student_ids": [student_data['student_id']]},
+            headers={'Authorization': f'Bearer {self.teacher_token}'}
+        )
+        if response.status_code != 200:
+            self.log_test("Cohort Dashboards", False, f"Expected 200, got {response.status_code}")
+            return False, []
+
+        dashboards = [json.loads(line) for line in response.text.splitlines() if line]
+        if len(dashboards) != 1 or dashboards[0]['student']['student_id'] != student_data['student_id']:
+            self.log_test("Cohort Dashboards", False, f"Unexpected stream: {dashboards}")
+            return False, dashboards
+
+        print(f"   CGPA: {dashboards[0]['cgpa']}")
+        self.log_test("Cohort Dashboards", True)
+        return True, dashboards
+
+    def test_cohort_dashboards_require_scope(self, student_data):
+        """Test that the batch dashboard stream never defaults to the whole cohort"""
+        success, _ = self.run_test(
+            "Cohort Dashboards Without Scope",
+            "POST",
+            "dashboard/batch",
+            400,
+            data={"department": student_data['department']},
+            headers={'Authorization': f'Bearer {self.teacher_token}'}
+        )
+        return success
+
     def run_comprehensive_test(self):
         """Run all tests in sequence"""
         print("🚀 Starting Comprehensive API Testing for Student Marks Dashboard")
@@ -324,15 +568,31 @@ class StudentMarksAPITester:
             print("❌ Student registration failed, stopping tests")
             return self.generate_report()
 
+        # Test login against the stored password hashes
+        self.test_teacher_login(teacher_user['email'])
+        self.test_student_login(student_user['student_id'])
+        self.test_wrong_password_login(student_user['student_id'])
+
         # Test auth/me endpoints
         self.test_auth_me(self.teacher_token, "teacher")
         self.test_auth_me(self.student_token, "student")
+        self.test_round_trip_report(self.student_token)
+
+        # Test grading scheme lookup
+        self.test_get_grading_scheme(teacher_user['department'])
+
+        # Test roster import
+        self.test_import_students(student_user)
+
+        # Test typeahead search
+        self.test_search_students(student_user)
 
         # Test subject creation
         subject_success, subject_data = self.test_create_subject()
         
         # Test getting subjects
         self.test_get_subjects()
+        self.test_subjects_not_modified()
 
         # Test getting students
         self.test_get_students()
@@ -344,11 +604,25 @@ class StudentMarksAPITester:
                 subject_data.get('id')
             )
 
+            # Test bulk upload (re-saves the same marks)
+            self.test_bulk_upload_marks(
+                student_user['id'],
+                subject_data.get('id')
+            )
+
             # Test getting student marks
             self.test_get_student_marks(student_user['id'])
 
             # Test student dashboard
             self.test_student_dashboard(student_user)
+            self.test_dashboard_not_modified(student_user)
+
+            # Test subject statistics
+            self.test_subject_analytics(subject_data.get('id'))
+
+            # Test the cohort batch dashboards
+            self.test_cohort_dashboards(student_user)
+            self.test_cohort_dashboards_require_scope(student_user)
 
         return self.generate_report()
 
@@ -43,6 +43,7 @@ const Auth = ({ onLogin }) => {
           name: formData.name,
           role: formData.role,
           department: formData.department,
+          password: formData.password,
           ...(formData.role === 'teacher' ? { email: formData.email } : { student_id: formData.student_id, semester: parseInt(formData.semester) })
         };
         const response = await axios.post(`${API}/auth/register`, registerData);
@@ -98,12 +99,10 @@ const Auth = ({ onLogin }) => {
                       id="password"
                       type="password"
                       data-testid="login-password-input"
-                      placeholder="student or teacher"
                       value={formData.password}
                       onChange={(e) => setFormData({ ...formData, password: e.target.value })}
                       required
                     />
-                    <p className="text-xs text-gray-500 mt-1">Students use 'student', Teachers use 'teacher'</p>
                   </div>
                   <Button type="submit" className="w-full button-primary text-white" disabled={loading} data-testid="login-submit-btn">
                     {loading ? 'Signing in...' : 'Sign In'}
@@ -191,10 +190,24 @@ const Auth = ({ onLogin }) => {
                     />
                   </div>
 
+                  <div>
+                    <Label htmlFor="register-password">Password</Label>
+                    <Input
+                      id="register-password"
+                      type="password"
+                      data-testid="register-password-input"
+                      minLength={8}
+                      maxLength={72}
+                      value={formData.password}
+                      onChange={(e) => setFormData({ ...formData, password: e.target.value })}
+                      required
+                    />
+                    <p className="text-xs text-gray-500 mt-1">At least 8 characters</p>
+                  </div>
+
                   <Button type="submit" className="w-full button-secondary text-white" disabled={loading} data-testid="register-submit-btn">
                     {loading ? 'Registering...' : 'Register'}
                   </Button>
-                  <p className="text-xs text-gray-500 text-center">Password: 'student' for students, 'teacher' for teachers</p>
                 </form>
               </TabsContent>
             </Tabs>
@@ -44,12 +44,23 @@ const TeacherDashboard = ({ user, token, onLogout }) => {
     fetchStudents();
   }, []);
 
+  // List endpoints are paginated: show the first page right away, then append the rest
+  const fetchAllPages = async (path, setItems) => {
+    const headers = { Authorization: `Bearer ${token}` };
+    const separator = path.includes('?') ? '&' : '?';
+    let response = await axios.get(`${API}/${path}`, { headers });
+    let items = response.data.items;
+    setItems(items);
+    while (response.data.next_cursor) {
+      response = await axios.get(`${API}/${path}${separator}after=${encodeURIComponent(response.data.next_cursor)}`, { headers });
+      items = [...items, ...response.data.items];
+      setItems(items);
+    }
+  };
+
   const fetchSubjects = async () => {
     try {
-      const response = await axios.get(`${API}/subjects?department=${user.department}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setSubjects(response.data);
+      await fetchAllPages(`subjects?department=${user.department}`, setSubjects);
     } catch (error) {
       console.error('Error fetching subjects:', error);
       toast.error('Failed to load subjects');
@@ -58,10 +69,7 @@ const TeacherDashboard = ({ user, token, onLogout }) => {
 
   const fetchStudents = async () => {
     try {
-      const response = await axios.get(`${API}/students?department=${user.department}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setStudents(response.data);
+      await fetchAllPages(`students?department=${user.department}`, setStudents);
     } catch (error) {
       console.error('Error fetching students:', error);
       toast.error('Failed to load students');
@@ -70,10 +78,7 @@ const TeacherDashboard = ({ user, token, onLogout }) => {
 
   const fetchSubjectMarks = async (subjectId) => {
     try {
-      const response = await axios.get(`${API}/marks/subject/${subjectId}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setSubjectMarks(response.data);
+      await fetchAllPages(`marks/subject/${subjectId}`, setSubjectMarks);
     } catch (error) {
       console.error('Error fetching marks:', error);
       toast.error('Failed to load marks');
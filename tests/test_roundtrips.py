@@ -0,0 +1,50 @@
+"""RoundTripMiddleware: the Server-Timing report and enforced route budgets"""
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from roundtrips import RoundTripMiddleware, current_stats
+
+
+def make_client(enforce: bool = True, size: int = None) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/queries/{count}")
+    async def queries(count: int):
+        # Stands in for the command listener charging `count` round trips
+        for _ in range(count):
+            current_stats().record(1, 0.001, size)
+        return {"count": count}
+
+    app.add_middleware(RoundTripMiddleware, budgets={("GET", "/queries/{count}"): 2}, enforce=enforce)
+    return TestClient(app)
+
+
+def test_server_timing_reports_commands_and_documents():
+    timing = make_client().get("/queries/2").headers["Server-Timing"]
+    assert re.fullmatch(r'mongo;dur=\d+\.\d{2};desc="2 commands, 2 docs"', timing)
+
+
+def test_server_timing_reports_bytes_when_measured():
+    timing = make_client(size=1536).get("/queries/2").headers["Server-Timing"]
+    assert timing.endswith('desc="2 commands, 2 docs, 3.0 KiB"')
+
+
+def test_request_within_budget_passes():
+    response = make_client().get("/queries/2")
+    assert response.status_code == 200
+    assert response.json() == {"count": 2}
+
+
+def test_request_over_budget_is_rejected_when_enforced():
+    response = make_client().get("/queries/3")
+    assert response.status_code == 500
+    assert response.json()["detail"] == "GET /queries/{count} made 3 MongoDB round trips (budget 2)"
+    assert response.headers["Server-Timing"].startswith("mongo;")
+
+
+def test_request_over_budget_only_warns_by_default():
+    response = make_client(enforce=False).get("/queries/3")
+    assert response.status_code == 200
+    assert response.json() == {"count": 3}
@@ -0,0 +1,157 @@
+"""SingleFlight: coalescing of concurrent calls and the short result window"""
+import asyncio
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight
+
+
+class Work:
+    """An `fn` for SingleFlight.do that counts its runs and waits to be released"""
+
+    def __init__(self, result="value", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+async def started(*coros):
+    """Schedule the calls and let each reach SingleFlight before returning their tasks"""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    await asyncio.sleep(0)
+    return tasks
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        tasks = await started(*(flight.do("key", work) for _ in range(10)))
+        assert flight.inflight() == 1
+        work.release.set()
+        results = await asyncio.gather(*tasks)
+        return work.calls, results, flight.inflight()
+
+    calls, results, inflight = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["value"] * 10
+    assert inflight == 0
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flight = SingleFlight("test")
+        first, second = Work("first"), Work("second")
+        tasks = await started(flight.do("a", first), flight.do("b", second))
+        first.release.set()
+        second.release.set()
+        return await asyncio.gather(*tasks), first.calls, second.calls
+
+    assert asyncio.run(scenario()) == (["first", "second"], 1, 1)
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    async def scenario():
+        flight = SingleFlight("test", window=60)
+        failing = Work(error=RuntimeError("boom"))
+        tasks = await started(*(flight.do("key", failing) for _ in range(3)))
+        failing.release.set()
+        errors = await asyncio.gather(*tasks, return_exceptions=True)
+
+        # The next call runs the work again instead of replaying the error
+        retry = Work("recovered")
+        retry.release.set()
+        return errors, await flight.do("key", retry), retry.calls
+
+    errors, result, calls = asyncio.run(scenario())
+    assert [str(error) for error in errors] == ["boom"] * 3
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert (result, calls) == ("recovered", 1)
+
+
+def test_window_serves_a_finished_result_until_it_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(singleflight.time, "monotonic", lambda: now[0])
+
+    async def scenario():
+        flight = SingleFlight("test", window=5)
+        work = Work()
+        work.release.set()
+        results = [await flight.do("key", work)]
+        now[0] += 4
+        results.append(await flight.do("key", work))
+        calls_within_window = work.calls
+        now[0] += 2
+        results.append(await flight.do("key", work))
+        return results, calls_within_window, work.calls
+
+    results, calls_within_window, calls = asyncio.run(scenario())
+    assert results == ["value"] * 3
+    assert calls_within_window == 1
+    assert calls == 2
+
+
+def test_without_window_every_call_after_completion_runs_again():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        work.release.set()
+        await flight.do("key", work)
+        await flight.do("key", work)
+        return work.calls
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_window_keeps_at_most_maxsize_results():
+    async def scenario():
+        flight = SingleFlight("test", window=60, maxsize=2)
+        work = Work()
+        work.release.set()
+        for key in ("a", "b", "c"):
+            await flight.do(key, work)
+        # "a" was evicted as the oldest; "c" is still cached
+        await flight.do("c", work)
+        await flight.do("a", work)
+        return work.calls
+
+    assert asyncio.run(scenario()) == 4
+
+
+def test_cancelled_leader_does_not_cancel_the_shared_work():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        leader, follower = await started(flight.do("key", work), flight.do("key", work))
+        # The leader's client disconnects while the work is in flight
+        leader.cancel()
+        await asyncio.sleep(0)
+        work.release.set()
+        return leader.cancelled(), await follower, work.calls, flight.inflight()
+
+    assert asyncio.run(scenario()) == (True, "value", 1, 0)
+
+
+def test_call_after_leader_cancelled_joins_the_running_work():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        (leader,) = await started(flight.do("key", work))
+        leader.cancel()
+        await asyncio.sleep(0)
+        (late,) = await started(flight.do("key", work))
+        work.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await late, work.calls
+
+    assert asyncio.run(scenario()) == ("value", 1)